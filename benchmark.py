@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+# --- BENCHMARK / LOAD TEST ---
+# Builds the app against a local SQLite file (NOT the real MySQL database), fills it with fake users and posts,
+# then hammers every route and reports throughput, latency percentiles, queries per request and memory
+# (how much the process's peak RSS grew during each route, and the peak itself).
+#
+# Examples:
+#   python benchmark.py                                   # small default dataset
+#   python benchmark.py --users 100000 --posts 1000000    # big dataset (seeding takes a while, and is reused next time)
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json   # exit code 1 if anything got slower
+#   python benchmark.py --bulk                            # also time "flask export" / "flask import"
+
+BENCH_PASSWORD = 'Benchmark1!'
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+         'magna aliqua flask python database query index cache server request template expedition hiking camp '
+         'volunteer skills physical bronze silver gold award').split()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark every route in main.py against a local database.')
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'dofe_benchmark.sqlite'),
+                        help='SQLite file to use (reused between runs if the scale matches)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per route before measuring')
+    parser.add_argument('--concurrency', type=int, default=1, help='number of client threads')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, so runs are reproducible')
+    parser.add_argument('--reseed', action='store_true', help='rebuild the dataset even if it already exists')
+    parser.add_argument('--no-page-cache', action='store_true', help='benchmark with the page cache switched off')
+    parser.add_argument('--bulk', action='store_true', help='also time "flask export" and "flask import" on the dataset')
+    parser.add_argument('--batch-size', type=int, default=1000, help='batch size for the --bulk import')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown before flagging (0.10 = 10%%)')
+    return parser.parse_args()
+
+
+def load_app(args):
+    # config.py reads its settings from environment variables when it is imported,
+    # so we set them BEFORE importing main. load_dotenv() never overrides variables that are already set.
+    # The production config is used, so we measure what the real server does (with SQLite instead of MySQL).
+    os.environ['DB_URI'] = f'sqlite:///{os.path.abspath(args.db)}'
+    os.environ['RATE_LIMIT_BURST'] = str(10 ** 9)   # we are one "IP address" making thousands of logins
+    os.environ['PAGE_CACHE_ENABLED'] = '0' if args.no_page_cache else '1'
+    os.environ['METRICS_TRACE_SAMPLE_RATE'] = '0'
+    os.environ['SEARCH_INDEX_PATH'] = f'{os.path.abspath(args.db)}.search_index.json'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    import main
+    app = main.create_app('production')
+    app.config['TESTING'] = True
+    return main, app
+
+
+def seed(main, app, args):
+    from sqlalchemy import insert
+    import post_summary
+    db, User, Post = main.db, main.User, main.Post
+    with app.app_context():
+        db.create_all()
+        # A dataset seeded by an older version of the app is missing the excerpt and counter columns
+        if post_summary.add_missing_columns(db, Post, ['excerpt']) + \
+                post_summary.add_missing_columns(db, User, ['post_count', 'last_posted_at']):
+            for _ in post_summary.backfill_excerpts(db, Post):
+                pass
+            for _ in post_summary.backfill_user_counters(db, User, Post):
+                pass
+        if not args.reseed and User.query.count() == args.users and Post.query.count() == args.posts:
+            print(f'Reusing existing dataset in {args.db}')
+            return
+        print(f'Seeding {args.users} users and {args.posts} posts into {args.db} ...')
+        db.drop_all()
+        db.create_all()
+        rng = random.Random(args.seed)
+        # One real scrypt hash shared by every fake user, so they can all log in with BENCH_PASSWORD
+        password_hash = main.password_hasher.hash(BENCH_PASSWORD)
+
+        batch_size = 10000
+        for start in range(0, args.users, batch_size):
+            rows = [{'id': i + 1, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash}
+                    for i in range(start, min(start + batch_size, args.users))]
+            db.session.execute(insert(User), rows)
+        db.session.commit()
+
+        first_date = datetime(2020, 1, 1)
+        for start in range(0, args.posts, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, args.posts)):
+                # (title first, so the same --seed still gives the same dataset as before)
+                title = ' '.join(rng.choices(WORDS, k=rng.randint(2, 8))).capitalize()
+                content = ' '.join(rng.choices(WORDS, k=rng.randint(10, 300)))
+                rows.append({'title': title,
+                             'content': content,
+                             'excerpt': post_summary.make_excerpt(content),
+                             'date_posted': first_date + timedelta(minutes=i),
+                             'user_id': rng.randint(1, args.users)})
+            db.session.execute(insert(Post), rows)
+            db.session.commit()
+        # post_count / last_posted_at for every user, in batches
+        for _ in post_summary.backfill_user_counters(db, User, Post, batch_size=batch_size):
+            pass
+
+        # Build the search index snapshot now, so the benchmark doesn't time the first full rebuild
+        main.search_index.rebuild(Post)
+        main.search_index.save(merge=False)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class QueryCounter:
+    # Counts SQL statements per thread, so each request's query count can be read back afterwards
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self._local = threading.local()
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    def read(self):
+        return getattr(self._local, 'count', 0)
+
+
+def failed(response):
+    # Errors are not always 4xx/5xx: the forms answer a failed POST by redirecting back to themselves
+    # (a wrong password sends /login back to /login), and pages that need a login redirect to /login.
+    # Only a successful /register is supposed to continue at /login.
+    if response.status_code >= 400:
+        return True
+    if response.status_code in (301, 302, 303, 307, 308):
+        path = response.request.path
+        target = urlsplit(response.location).path
+        return target == path or (target == '/login' and path != '/register')
+    return False
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux. It only covers this process, not the password hashing pool.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_route(app, counter, args, name, make_request):
+    # make_request(client, i) performs request number i and returns the response
+    def one(i):
+        client = app.test_client()
+        counter.reset()
+        started = time.perf_counter()
+        response = make_request(client, i)
+        # Streamed responses (the JSON API) only run their queries while the body is read
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        return elapsed, counter.read(), failed(response)
+
+    for i in range(args.warmup):
+        one(-1 - i)
+
+    # ru_maxrss is the highest the process has EVER used, so on its own it mostly reflects the routes that
+    # ran before this one. How much it grew while this route ran is the part that belongs to this route.
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(one, range(args.requests)))
+    wall_time = time.perf_counter() - started
+    rss_after = peak_rss_mb()
+
+    latencies = sorted(elapsed for elapsed, queries, error in results)
+    result = {
+        'requests': len(results),
+        'errors': sum(1 for elapsed, queries, error in results if error),
+        'throughput_rps': len(results) / wall_time if wall_time else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': sum(queries for elapsed, queries, error in results) / len(results),
+        'rss_growth_mb': rss_after - rss_before,
+        'process_peak_rss_mb': rss_after,
+    }
+    print(f"{name:<16} {result['throughput_rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.2f}ms  "
+          f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  "
+          f"{result['queries_per_request']:>5.1f} q/req  {result['errors']} errors  "
+          f"RSS +{result['rss_growth_mb']:.1f}MB (process peak {result['process_peak_rss_mb']:.0f}MB)")
+    return result
+
+
+def run_benchmarks(main, app, args):
+    from sqlalchemy import func
+    rng = random.Random(args.seed)
+    run_id = int(time.time())
+
+    with app.app_context():
+        counter = QueryCounter(main.db.engine)
+        bench_user = main.db.session.get(main.User, 1)
+        # A few real cursors from the middle of the feed, to benchmark "older posts" pages
+        post_count = main.Post.query.count()
+        sample_posts = main.Post.query.filter(main.Post.id.in_([rng.randint(1, post_count) for _ in range(50)])).all()
+        cursors = [main.format_cursor(post) for post in sample_posts]
+        usernames = [f'user{rng.randrange(args.users)}' for _ in range(1000)]
+        last_post_id = main.db.session.query(func.max(main.Post.id)).scalar() or 0
+
+    def logged_in_client(client):
+        with client.session_transaction() as sess:
+            sess['user_id'] = bench_user.id
+        return client
+
+    def created_post_id(i):
+        # The posts made by the "create" benchmark are edited and then deleted by the later benchmarks
+        return last_post_id + args.warmup + i + 1
+
+    routes = [
+        ('home', lambda client, i: client.get('/')),
+        ('home_older', lambda client, i: client.get('/', query_string={'before': cursors[i % len(cursors)]})),
+        ('user_profile', lambda client, i: client.get(f'/user/{usernames[i % len(usernames)]}')),
+        ('post_detail', lambda client, i: client.get(f'/post/{sample_posts[i % len(sample_posts)].id}')),
+        ('search', lambda client, i: client.get('/search', query_string={'q': rng.choice(WORDS)})),
+        ('api_posts', lambda client, i: client.get('/api/posts')),
+        ('api_posts_older', lambda client, i: client.get('/api/posts', query_string={'before': cursors[i % len(cursors)]})),
+        ('account', lambda client, i: logged_in_client(client).get('/account')),
+        ('login', lambda client, i: client.post('/login', data={'username': usernames[i % len(usernames)],
+                                                                 'password': BENCH_PASSWORD})),
+        ('register', lambda client, i: client.post('/register', data={'username': f'bench{run_id}_{i}',
+                                                                       'email': f'bench{run_id}_{i}@example.com',
+                                                                       'password': BENCH_PASSWORD})),
+        ('create', lambda client, i: logged_in_client(client).post('/create', data={'title': f'Benchmark post {i}',
+                                                                                     'content': 'lorem ipsum ' * 50})),
+        ('update', lambda client, i: logged_in_client(client).post(f'/post/{created_post_id(i)}/update',
+                                                                    data={'title': f'Edited {i}', 'content': 'edited'})),
+        ('delete', lambda client, i: logged_in_client(client).post(f'/post/{created_post_id(i)}/delete')),
+    ]
+    return {name: run_route(app, counter, args, name, make_request) for name, make_request in routes}
+
+
+def run_bulk(main, args):
+    # Times the real CLI commands in a subprocess: export the benchmark database, then import it into an empty one
+    from sqlalchemy import create_engine
+    dump_path = f'{os.path.abspath(args.db)}.export.ndjson'
+    target_path = f'{os.path.abspath(args.db)}.import.sqlite'
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    engine = create_engine(f'sqlite:///{target_path}')
+    main.db.metadata.create_all(engine)
+    engine.dispose()
+
+    rows = args.users + args.posts
+    results = {}
+    for name, db_path, command in (
+            ('bulk_export', args.db, ['export', dump_path]),
+            ('bulk_import', target_path, ['import', dump_path, '--batch-size', str(args.batch_size)])):
+        env = dict(os.environ, DB_URI=f'sqlite:///{os.path.abspath(db_path)}')
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', *command], env=env, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True)
+        elapsed = time.perf_counter() - started
+        results[name] = {'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / elapsed if elapsed else 0.0}
+        print(f"{name:<16} {results[name]['rows_per_second']:>9.0f} rows/s  ({rows} rows in {elapsed:.1f}s)")
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    # Flag any route whose p95 latency rose, or whose throughput fell, by more than the threshold
+    with open(baseline_path) as f:
+        baseline = json.load(f)['routes']
+    regressions = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if 'rows_per_second' in before:
+            if current['rows_per_second'] < before['rows_per_second'] * (1 - threshold):
+                regressions.append(f"{name}: {before['rows_per_second']:.0f} -> {current['rows_per_second']:.0f} rows/s")
+            continue
+        if before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if before['throughput_rps'] and current['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']:.1f} -> {current['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_cli():
+    args = parse_args()
+    app_module, app = load_app(args)
+    seed(app_module, app, args)
+    results = run_benchmarks(app_module, app, args)
+    if args.bulk:
+        results.update(run_bulk(app_module, args))
+
+    if args.output:
+        report = {
+            'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                     'python': platform.python_version(), 'users': args.users, 'posts': args.posts,
+                     'requests': args.requests, 'concurrency': args.concurrency, 'page_cache': not args.no_page_cache},
+            'routes': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions compared to', args.compare)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,215 @@
+import csv
+import json
+import time
+from datetime import datetime
+from sqlalchemy import insert, update
+from post_summary import make_excerpt, recount_users
+
+# --- BULK IMPORT / EXPORT ---
+# Moving data through /register and /create one row at a time is very slow (a password hash + a commit per row).
+# These helpers read and write users and posts as NDJSON (one JSON object per line) or CSV, streaming row by row
+# so memory use stays flat however big the file is. Imports are written in batches: one INSERT statement with
+# many rows ("executemany") instead of one statement per row, and a commit every few thousand rows.
+#
+# NDJSON lines carry a "type" ("user" or "post"); a CSV file holds one table.
+# Users keep their password_hash exactly as exported - passwords are never re-hashed.
+# Posts refer to their author by username, so an export can be imported into a database with different ids.
+# Excerpts and the authors' post counters are derived data: they are worked out on import, never read from the file.
+# A new post without a date_posted is dated "now"; an updated one (--upsert) keeps the date it already has.
+
+FIELDS = {
+    'user': ['username', 'email', 'password_hash'],
+    'post': ['id', 'title', 'content', 'date_posted', 'author'],
+}
+
+
+# --- Export ---
+def export_rows(User, Post, types=('user', 'post'), batch_size=1000):
+    # Yields (type, row) pairs. yield_per streams from a server-side cursor instead of loading every row.
+    if 'user' in types:
+        users = User.query.with_entities(User.username, User.email, User.password_hash).order_by(User.id)
+        for username, email, password_hash in users.yield_per(batch_size):
+            yield 'user', {'username': username, 'email': email, 'password_hash': password_hash}
+    if 'post' in types:
+        posts = Post.query.join(User, User.id == Post.user_id) \
+                          .with_entities(Post.id, Post.title, Post.content, Post.date_posted, User.username) \
+                          .order_by(Post.id)
+        for post_id, title, content, date_posted, author in posts.yield_per(batch_size):
+            yield 'post', {'id': post_id, 'title': title, 'content': content,
+                           'date_posted': date_posted.isoformat(), 'author': author}
+
+
+def write_ndjson(rows, f):
+    count = 0
+    for row_type, row in rows:
+        f.write(json.dumps({'type': row_type, **row}) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(rows, f, row_type):
+    writer = csv.DictWriter(f, fieldnames=FIELDS[row_type])
+    writer.writeheader()
+    count = 0
+    for _, row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+# --- Import ---
+def read_ndjson(f):
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        row_type = row.pop('type', None)
+        if row_type not in FIELDS:
+            raise ValueError(f'line {line_number}: "type" must be "user" or "post"')
+        yield row_type, row
+
+
+def read_csv(f, row_type):
+    for row in csv.DictReader(f):
+        # CSV has no "null", so empty cells mean "not given"
+        yield row_type, {key: value for key, value in row.items() if value != ''}
+
+
+class Importer:
+    def __init__(self, db, User, Post, batch_size=1000, commit_every=10000, upsert=False, before_commit=None):
+        self.db = db
+        self.User = User
+        self.Post = Post
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.upsert = upsert # True: existing rows are updated. False: existing rows are skipped. Both are safe to re-run.
+        # Called just before every commit, so e.g. version counters change in the same transaction as the rows
+        self.before_commit = before_commit
+        self._pending = {'user': [], 'post': []}
+        self._since_commit = 0
+        self.started = time.perf_counter()
+        self.stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+    def add(self, row_type, row):
+        if row_type == 'post' and self._pending['user']:
+            # A post may belong to a user that is still waiting in the user batch
+            self._flush('user')
+        self._pending[row_type].append(row)
+        if len(self._pending[row_type]) >= self.batch_size:
+            self._flush(row_type)
+
+    def finish(self):
+        self._flush('user')
+        self._flush('post')
+        self._commit()
+        return self.stats
+
+    def _commit(self):
+        if self.before_commit is not None:
+            self.before_commit()
+        self.db.session.commit()
+
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        done = self.stats['inserted'] + self.stats['updated'] + self.stats['skipped']
+        return done / elapsed if elapsed else 0.0
+
+    def _flush(self, row_type):
+        rows, self._pending[row_type] = self._pending[row_type], []
+        if not rows:
+            return
+        if row_type == 'user':
+            self._flush_users(rows)
+        else:
+            self._flush_posts(rows)
+        self._since_commit += len(rows)
+        if self._since_commit >= self.commit_every:
+            self._commit()
+            self._since_commit = 0
+
+    def _flush_users(self, rows):
+        User = self.User
+        for row in rows:
+            missing = [field for field in FIELDS['user'] if not row.get(field)]
+            if missing:
+                raise ValueError(f'user {row.get("username")!r} is missing {", ".join(missing)}')
+        # If the same user appears twice in one batch, the last one wins
+        rows = list({row['username']: row for row in rows}.values())
+
+        # ONE query finds every user in this batch that already exists (by username OR email)
+        existing = User.query.with_entities(User.id, User.username, User.email).filter(
+            User.username.in_([row['username'] for row in rows]) | User.email.in_([row['email'] for row in rows]))
+        by_username, by_email = {}, {}
+        for user_id, username, email in existing:
+            by_username[username] = user_id
+            by_email[email] = user_id
+
+        inserts, updates = [], []
+        for row in rows:
+            values = {field: row[field] for field in FIELDS['user']}
+            matches = {by_username.get(row['username']), by_email.get(row['email'])} - {None}
+            if not matches:
+                inserts.append(values)
+            elif self.upsert and len(matches) == 1:
+                updates.append({'id': matches.pop(), **values})
+            else:
+                # Already there (or the username and email belong to two DIFFERENT users - we can't merge those)
+                self.stats['skipped'] += 1
+        if inserts:
+            self.db.session.execute(insert(User), inserts)
+        if updates:
+            self.db.session.execute(update(User), updates) # bulk UPDATE by primary key
+        self.stats['inserted'] += len(inserts)
+        self.stats['updated'] += len(updates)
+
+    def _flush_posts(self, rows):
+        User, Post = self.User, self.Post
+        # If the same post id appears twice in one batch, the last one wins (rows without an id are all new posts)
+        rows = [row for row in rows if not row.get('id')] + \
+            list({int(row['id']): row for row in rows if row.get('id')}.values())
+        # Look up every author in the batch with one query
+        usernames = {row['author'] for row in rows if row.get('author')}
+        author_ids = dict(User.query.with_entities(User.username, User.id).filter(User.username.in_(usernames))) \
+            if usernames else {}
+        post_ids = [int(row['id']) for row in rows if row.get('id')]
+        # id -> current author, so an upsert that moves a post to another user recounts BOTH users
+        existing_authors = dict(Post.query.with_entities(Post.id, Post.user_id).filter(Post.id.in_(post_ids))) \
+            if post_ids else {}
+
+        inserts, updates = [], []
+        for row in rows:
+            user_id = author_ids.get(row.get('author')) or row.get('user_id')
+            if not user_id or not row.get('title') or not row.get('content'):
+                raise ValueError(f'post {row.get("id") or row.get("title")!r} needs a title, content and a known author')
+            values = {
+                'title': row['title'],
+                'content': row['content'],
+                'excerpt': make_excerpt(row['content']),
+                'user_id': int(user_id),
+            }
+            if row.get('date_posted'):
+                values['date_posted'] = datetime.fromisoformat(row['date_posted'])
+            if row.get('id'):
+                values['id'] = int(row['id'])
+            if values.get('id') not in existing_authors:
+                values.setdefault('date_posted', datetime.utcnow())
+                inserts.append(values)
+            elif self.upsert:
+                updates.append(values)
+            else:
+                self.stats['skipped'] += 1
+        if inserts:
+            # Rows with and without an id can't share one executemany statement
+            with_id = [values for values in inserts if 'id' in values]
+            without_id = [values for values in inserts if 'id' not in values]
+            for batch in (with_id, without_id):
+                if batch:
+                    self.db.session.execute(insert(Post), batch)
+        if updates:
+            self.db.session.execute(update(Post), updates)
+        # Bring post_count / last_posted_at of every author in this batch up to date (one UPDATE statement)
+        authors = {values['user_id'] for values in inserts + updates}
+        authors |= {existing_authors[values['id']] for values in updates}
+        recount_users(self.db, User, Post, authors)
+        self.stats['inserted'] += len(inserts)
+        self.stats['updated'] += len(updates)
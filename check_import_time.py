@@ -0,0 +1,97 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# --- IMPORT TIME CHECK ---
+# gunicorn imports main.py in every new worker it starts, so a slow import means slow restarts.
+# This script measures the import in a fresh Python process with "python -X importtime", prints the slowest
+# modules, and exits with code 1 when:
+#   * importing main takes longer than the budget, or
+#   * importing main (or calling create_app) pulls in a module that should only be loaded when it is
+#     actually used (see LAZY_MODULES), or
+#   * create_app('testing') takes longer than its budget.
+#
+# Examples:
+#   python check_import_time.py
+#   python check_import_time.py --budget-ms 500 --top 25
+
+# Default budgets, in milliseconds (also used by tests/test_import_time.py)
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 1000))
+CREATE_APP_BUDGET_MS = float(os.getenv('CREATE_APP_BUDGET_MS', 250))
+
+# Modules main.py must NOT import up front (they are imported the first time they are needed)
+LAZY_MODULES = (
+    'flask_mail',                  # only when an email is sent (mail_queue.py / reset_request)
+    'concurrent.futures.process',  # only when the password hashing pool starts (password_hasher.py)
+    'multiprocessing',
+    'redis',                       # only when PAGE_CACHE_REDIS_URL is set (page_cache.py)
+)
+
+# Runs in the child process: import main (timed by -X importtime), then time create_app()
+CHILD = '''
+import time
+import main
+started = time.perf_counter()
+main.create_app('testing')
+print('create_app_ms', (time.perf_counter() - started) * 1000)
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check that importing main.py stays fast.')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS,
+                        help='maximum time for "import main", in milliseconds')
+    parser.add_argument('--create-app-budget-ms', type=float, default=CREATE_APP_BUDGET_MS,
+                        help="maximum time for create_app('testing'), in milliseconds")
+    parser.add_argument('--top', type=int, default=15, help='how many of the slowest imports to print')
+    return parser.parse_args()
+
+
+def measure():
+    # Returns ({module: (self microseconds, cumulative microseconds)}, create_app milliseconds)
+    # A new process each time, so nothing is already imported (or cached in sys.modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        # Lines look like: "import time:       882 |       9842 |   flask_mail"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # The first time a module is imported is the one that counts
+        modules.setdefault(name.strip(), (int(self_us), int(cumulative_us)))
+    create_app_ms = float(result.stdout.split()[-1])
+    return modules, create_app_ms
+
+
+def main_cli():
+    args = parse_args()
+    modules, create_app_ms = measure()
+    import_ms = modules['main'][1] / 1000
+
+    print('Slowest imports (cumulative):')
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f'  {cumulative_us / 1000:>8.1f}ms  {name}')
+
+    problems = []
+    if import_ms > args.budget_ms:
+        problems.append(f'import main took {import_ms:.0f}ms (budget {args.budget_ms:.0f}ms)')
+    if create_app_ms > args.create_app_budget_ms:
+        problems.append(f"create_app('testing') took {create_app_ms:.0f}ms (budget {args.create_app_budget_ms:.0f}ms)")
+    for name in LAZY_MODULES:
+        if name in modules:
+            problems.append(f'starting the app imported {name}, which should only be imported when it is used')
+
+    print(f'import main: {import_ms:.0f}ms (budget {args.budget_ms:.0f}ms), '
+          f"create_app('testing'): {create_app_ms:.0f}ms (budget {args.create_app_budget_ms:.0f}ms)")
+    for problem in problems:
+        print(f'FAIL {problem}')
+    if problems:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main_cli()
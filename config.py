@@ -0,0 +1,127 @@
+import os
+from dotenv import load_dotenv
+
+# --- CONFIGURATION ---
+# All settings live here instead of being scattered through main.py.
+# create_app('development' / 'testing' / 'production') picks one of the classes below.
+# Most values can be overridden from the environment or the .env file.
+
+# Load the variables from the .env file (variables that are already set are NOT overridden)
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def env_flag(name, default):
+    return os.getenv(name, default) == '1'
+
+
+class Config:
+    SECRET_KEY = os.getenv('SECRET_KEY')
+
+    # --- DATABASE ---
+    # Format: mysql+pymysql://<username>:<password>@<host>/<database_name>
+    # For XAMPP default: username is 'root', there is no password, host is 'localhost', and the project's database 'dofe_project'
+    DB_URI = os.getenv('DB_URI', 'mysql+pymysql://root:@localhost/dofe_project')
+    # Optional read replicas, comma separated. GET requests of @read_only views read from them.
+    DB_REPLICA_URIS = [uri.strip() for uri in os.getenv('DB_REPLICA_URIS', '').split(',') if uri.strip()]
+    DB_REPLICA_STICKY_SECONDS = float(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+    # Connection pool settings (see database.py for what each one does)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 280))
+    DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', '1')
+    # Disable unwanted feature of SQLAlchemy that isn't needed for this project
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # --- EMAIL ---
+    # Server/port can be overridden in .env, e.g. to point at a local test SMTP server
+    MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
+    MAIL_USE_TLS = env_flag('MAIL_USE_TLS', '1')
+    MAIL_USERNAME = os.getenv('MAIL_USERNAME') # <--- Secure!
+    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    # Emails are sent in the background by worker threads (see mail_queue.py)
+    MAIL_QUEUE_MAXSIZE = int(os.getenv('MAIL_QUEUE_MAXSIZE', 1000))
+    MAIL_QUEUE_WORKERS = int(os.getenv('MAIL_QUEUE_WORKERS', 1))
+    MAIL_QUEUE_BATCH_SIZE = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 20))
+    MAIL_QUEUE_MAX_ATTEMPTS = int(os.getenv('MAIL_QUEUE_MAX_ATTEMPTS', 5))
+    MAIL_QUEUE_RETRY_DELAY = float(os.getenv('MAIL_QUEUE_RETRY_DELAY', 2.0))
+    # At shutdown, wait this long for unsent messages (keep it below gunicorn's graceful_timeout)
+    MAIL_QUEUE_EXIT_TIMEOUT = float(os.getenv('MAIL_QUEUE_EXIT_TIMEOUT', 10))
+
+    # --- PASSWORD HASHING (see password_hasher.py) ---
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Every web worker process (gunicorn -w) starts its OWN hashing pool and has its OWN limit on waiting jobs.
+    # They are per process, not for the whole server: with 4 web workers there are 4 pools and 4 queues.
+    # So by default the CPU cores are shared out between the web workers. Set WEB_CONCURRENCY to the number
+    # of web workers (gunicorn also reads WEB_CONCURRENCY as its default for -w).
+    WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', max(1, PASSWORD_HASH_WORKERS) * 4))
+    # Token buckets: 5 attempts in a burst, then 1 every 6 seconds per IP address (and per username for logins).
+    # Like the hashing pool, each web worker process keeps its own buckets.
+    RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', 1 / 6))
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 5))
+
+    # --- CACHES ---
+    # Rendered HTML for the home feed and profile pages is kept in memory for PAGE_CACHE_TTL seconds
+    # (at most PAGE_CACHE_MAX_ENTRIES pages). Set PAGE_CACHE_REDIS_URL to share the cache between workers.
+    # Invalidation reaches every worker either way: the cache generations are kept in the database.
+    PAGE_CACHE_ENABLED = env_flag('PAGE_CACHE_ENABLED', '1')
+    PAGE_CACHE_MAX_ENTRIES = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', 512))
+    PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', 60))
+    PAGE_CACHE_REDIS_URL = os.getenv('PAGE_CACHE_REDIS_URL')
+    # Logged-in user records (see get_current_user() in main.py). Each worker has its own copy, so after
+    # a rename the other workers can show the old name for up to USER_CACHE_TTL seconds.
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 1024))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+
+    # --- SEARCH INDEX (see search_index.py) ---
+    SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', os.path.join(BASE_DIR, 'search_index.json'))
+
+    # --- METRICS (see request_metrics.py) ---
+    METRICS_TRACE_SAMPLE_RATE = float(os.getenv('METRICS_TRACE_SAMPLE_RATE', 0.01))
+
+    # --- RESPONSE OPTIMISATION (see response_optimizer.py) ---
+    RESPONSE_COMPRESSION_ENABLED = env_flag('RESPONSE_COMPRESSION_ENABLED', '1')
+    RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 500))
+    RESPONSE_COMPRESSION_LEVEL = int(os.getenv('RESPONSE_COMPRESSION_LEVEL', 6))
+    RESPONSE_ETAGS_ENABLED = env_flag('RESPONSE_ETAGS_ENABLED', '1')
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class TestingConfig(Config):
+    # Everything in memory: no MySQL, no SMTP server and no files needed
+    TESTING = True
+    SECRET_KEY = 'testing'
+    DB_URI = 'sqlite://'
+    DB_REPLICA_URIS = []
+    PASSWORD_HASH_WORKERS = 0 # hash on the request thread, no process pool
+    RATE_LIMIT_BURST = 10 ** 9
+    SEARCH_INDEX_PATH = None  # don't read or write a snapshot file
+    METRICS_TRACE_SAMPLE_RATE = 0
+
+
+class ProductionConfig(Config):
+    pass
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def get_config(config=None):
+    # Accepts a name ('testing'), a config class, or None (then APP_CONFIG from the environment decides)
+    if config is None:
+        config = os.getenv('APP_CONFIG', 'production')
+    if isinstance(config, str):
+        return CONFIGS[config]
+    return config
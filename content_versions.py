@@ -0,0 +1,56 @@
+from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+# --- CONTENT VERSIONS ---
+# A tiny table of counters, one row per "thing that can change", e.g.
+#   'posts'                   every post and every author name (the JSON API's ETag / Last-Modified)
+#   'page:home', 'page:...'   the page cache generations (see page_cache.py)
+# A write bumps the counters it affects in the SAME transaction as the change itself, so every worker process
+# (and every server) sees the new version at exactly the moment the change becomes visible - unlike a counter
+# kept in memory, which only the process that handled the write would know about.
+# Reading a version is one primary-key lookup, so it is cheap enough to do on every request.
+#
+# Every post write updates the same 'posts' row, so writers queue up on that row lock until they commit.
+# The transactions are short (a few statements), so this is fine at our write volume.
+
+
+class ContentVersions:
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    def get(self, name):
+        # Returns (version, changed_at). A counter that was never bumped is (0, None).
+        row = self.db.session.execute(
+            select(self.model.version, self.model.changed_at).where(self.model.name == name)).first()
+        return (row.version, row.changed_at) if row else (0, None)
+
+    def get_many(self, *names):
+        # {name: version} for several counters in one query
+        rows = self.db.session.execute(
+            select(self.model.name, self.model.version).where(self.model.name.in_(names)))
+        versions = dict.fromkeys(names, 0)
+        versions.update(rows.all())
+        return versions
+
+    def bump(self, *names):
+        # Call BEFORE db.session.commit(), so the new versions are committed together with the change
+        model, session = self.model, self.db.session
+        now = datetime.utcnow()
+        # Always lock the rows in the same (sorted) order, so two writers can never deadlock on them
+        for name in sorted(set(names)):
+            bumped = session.execute(update(model).where(model.name == name)
+                                     .values(version=model.version + 1, changed_at=now),
+                                     execution_options={'synchronize_session': False})
+            if bumped.rowcount:
+                continue
+            # First change of this counter: create its row. If another transaction creates it at the
+            # same moment, only the savepoint is rolled back and we bump the row it created instead.
+            try:
+                with session.begin_nested():
+                    session.execute(insert(model).values(name=name, version=1, changed_at=now))
+            except IntegrityError:
+                session.execute(update(model).where(model.name == name)
+                                .values(version=model.version + 1, changed_at=now),
+                                execution_options={'synchronize_session': False})
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+
+# --- DATABASE LAYER: CONNECTION POOL + READ REPLICAS ---
+# Opening a new MySQL connection for every request is slow, so SQLAlchemy keeps a "pool" of open connections.
+# The settings below come from .env so they can be tuned without code changes:
+#   DB_POOL_SIZE      connections kept open
+#   DB_MAX_OVERFLOW   extra connections allowed during a burst
+#   DB_POOL_TIMEOUT   seconds to wait for a free connection before giving up
+#   DB_POOL_RECYCLE   replace connections older than this (MySQL drops idle connections after a while)
+#   DB_POOL_PRE_PING  test each connection before using it, so a dropped one is replaced instead of causing an error
+#
+# Read replicas: if DB_REPLICA_URIS is set, SELECTs made by views marked with @read_only go to a replica,
+# while every write (and any read after a write) stays on the primary database.
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+class TimedQueuePool(QueuePool):
+    # A normal QueuePool that also measures how long callers wait to get a connection.
+    # If the wait grows, the pool is too small for the traffic.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        connection = super()._do_get()
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+
+def engine_options(config, uri):
+    # Pool settings only make sense for real client/server databases and SQLite FILES.
+    # An in-memory SQLite database lives inside one connection, so it can't be pooled.
+    if uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') in ('sqlite:', 'sqlite://')):
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def configure_database(app, primary_uri, replica_uris=()):
+    # Fills in the SQLAlchemy config for the primary database and every replica
+    app.config['SQLALCHEMY_DATABASE_URI'] = primary_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, primary_uri)
+    binds = {}
+    for number, uri in enumerate(replica_uris):
+        binds[f'{REPLICA_BIND_PREFIX}{number}'] = {'url': uri, **engine_options(app.config, uri)}
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['DB_REPLICA_COUNT'] = len(binds)
+
+
+def read_only(view):
+    # Decorator for views whose GET requests only read data: their SELECTs may be sent to a replica
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method == 'GET':
+            g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    # Inside this block (or a function decorated with @primary_reads()) every query goes to the primary,
+    # even in a @read_only view. Used for anything that must not be older than what another query already saw.
+    use_replica = g.get('use_replica', False)
+    g.use_replica = False
+    try:
+        yield
+    finally:
+        g.use_replica = use_replica
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replica_count = current_app.config['DB_REPLICA_COUNT']
+            return self._db.engines[f'{REPLICA_BIND_PREFIX}{random.randrange(replica_count)}']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if not has_request_context() or not g.get('use_replica'):
+            return False
+        if not current_app.config['DB_REPLICA_COUNT']:
+            return False
+        # Only plain SELECTs, never while flushing, and never once this request has written anything
+        if self._flushing or self.info.get('wrote') or not isinstance(clause, Select):
+            return False
+        return session.get('_primary_until', 0) < time.time()
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+    # After this user writes something, keep their reads on the primary for a few seconds.
+    # Otherwise the redirect after "Create Post" could hit a replica that hasn't received the new post yet.
+    if has_request_context() and current_app.config.get('DB_REPLICA_COUNT'):
+        session['_primary_until'] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
+
+
+def pool_stats(db):
+    # (name, type, help text, value) tuples for /metrics, one set per engine
+    stats = []
+    for bind_key, engine in db.engines.items():
+        pool = engine.pool
+        if not isinstance(pool, TimedQueuePool):
+            continue
+        name = bind_key or 'primary'
+        stats.extend([
+            (f'db_pool_{name}_checkouts_total', 'counter', f'Connections checked out of the {name} pool.', pool.checkouts),
+            (f'db_pool_{name}_checkout_wait_seconds_total', 'counter', f'Time spent waiting for a {name} connection.', pool.wait_seconds),
+            (f'db_pool_{name}_checkout_wait_seconds_max', 'gauge', f'Longest wait for a {name} connection.', pool.max_wait_seconds),
+            (f'db_pool_{name}_checked_out', 'gauge', f'{name} connections currently in use.', pool.checkedout()),
+            (f'db_pool_{name}_overflow', 'gauge', f'{name} connections open beyond pool_size.', pool.overflow()),
+        ])
+    return stats
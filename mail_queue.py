@@ -0,0 +1,171 @@
+import atexit
+import queue
+import threading
+import time
+import weakref
+
+# --- BACKGROUND MAIL QUEUE ---
+# Talking to an SMTP server (connect + TLS handshake + login + send) can easily take hundreds of milliseconds.
+# If we did that inside a request, the user would wait for it and the worker would be stuck.
+# Instead, the request just puts the message on a queue and returns straight away.
+# Background "worker" threads take messages off the queue and send them, reusing ONE SMTP
+# connection for a whole batch of messages. Failed messages are retried later with a growing delay (backoff).
+
+
+# The workers are daemon threads, which Python simply stops when the process exits - together with any
+# messages still waiting. So ONE exit hook waits (up to MAIL_QUEUE_EXIT_TIMEOUT seconds) for every queue
+# that has started its workers. Keep the timeout below the server's own shutdown timeout (gunicorn's
+# graceful_timeout, 30s by default), or the worker is killed before the hook is done.
+_running_queues = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for mail_queue in list(_running_queues):
+        mail_queue.flush_at_exit()
+
+
+class MailQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.mail = None
+        self._queue = None
+        self._threads = []
+        self._lock = threading.Lock()
+        # Condition used by flush() to wait until every message has been sent or given up on
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        # Simple counters so we can see how the queue is doing
+        self._stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'dropped': 0, 'batches': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_QUEUE_MAXSIZE', 1000)   # bounded, so a broken mail server can't eat all our memory
+        app.config.setdefault('MAIL_QUEUE_WORKERS', 1)
+        app.config.setdefault('MAIL_QUEUE_BATCH_SIZE', 20)  # max messages sent over one connection
+        app.config.setdefault('MAIL_QUEUE_MAX_ATTEMPTS', 5)
+        app.config.setdefault('MAIL_QUEUE_RETRY_DELAY', 2.0) # seconds, doubled after every failed attempt
+        app.config.setdefault('MAIL_QUEUE_EXIT_TIMEOUT', 10) # seconds to keep sending when the process exits
+        self.app = app
+        self.mail = None
+        self._queue = queue.Queue(maxsize=app.config['MAIL_QUEUE_MAXSIZE'])
+        app.extensions['mail_queue'] = self
+
+    def _get_mail(self):
+        # flask_mail is imported and set up the first time a worker sends something,
+        # so processes that never send mail don't pay for it
+        with self._lock:
+            if self.mail is None:
+                from flask_mail import Mail
+                self.mail = Mail(self.app)
+            return self.mail
+
+    def _start_workers(self):
+        # Threads are started lazily on the first message. Starting them at import time would break
+        # servers like gunicorn that fork worker processes after importing the app (threads don't survive a fork).
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.app.config['MAIL_QUEUE_WORKERS']):
+                thread = threading.Thread(target=self._worker, name=f'mail-queue-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            _running_queues.add(self)
+
+    def enqueue(self, msg):
+        # Returns True if the message was queued, False if the queue is full (the message is dropped)
+        self._start_workers()
+        with self._lock:
+            self._pending += 1
+        if not self._put(msg, attempt=1):
+            self.app.logger.warning('Mail queue is full, dropping message to %s', msg.recipients)
+            self._finish('dropped')
+            return False
+        with self._lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def _put(self, msg, attempt):
+        try:
+            self._queue.put_nowait((msg, attempt))
+            return True
+        except queue.Full:
+            return False
+
+    def _finish(self, outcome):
+        # Called exactly once per message, when it leaves the system for good
+        with self._lock:
+            self._stats[outcome] += 1
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _retry(self, msg, attempt):
+        if attempt >= self.app.config['MAIL_QUEUE_MAX_ATTEMPTS']:
+            self.app.logger.error('Giving up on mail to %s after %d attempts', msg.recipients, attempt)
+            self._finish('failed')
+            return
+        with self._lock:
+            self._stats['retried'] += 1
+        # Exponential backoff: 2s, 4s, 8s, ... A Timer puts the message back without blocking this worker.
+        delay = self.app.config['MAIL_QUEUE_RETRY_DELAY'] * (2 ** (attempt - 1))
+        def requeue():
+            if not self._put(msg, attempt + 1):
+                self._finish('dropped')
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _next_batch(self):
+        # Wait for one message, then grab whatever else is already waiting (up to the batch size)
+        batch = [self._queue.get()]
+        while len(batch) < self.app.config['MAIL_QUEUE_BATCH_SIZE']:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            with self._lock:
+                self._stats['batches'] += 1
+            sent = 0
+            # flask_mail needs an application context to read its configuration
+            with self.app.app_context():
+                try:
+                    # One connection (and one TLS handshake/login) for the whole batch
+                    with self._get_mail().connect() as connection:
+                        for msg, attempt in batch:
+                            connection.send(msg)
+                            sent += 1
+                            self._finish('sent')
+                except Exception as e:
+                    self.app.logger.warning('Sending mail failed: %s', e)
+                    # The connection may be broken now, so everything not yet sent goes back for a retry
+                    for msg, attempt in batch[sent:]:
+                        self._retry(msg, attempt)
+
+    def flush(self, timeout=None):
+        # Block until every queued message has been sent or given up on. Handy in tests and at shutdown.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def flush_at_exit(self):
+        if not self.flush(timeout=self.app.config['MAIL_QUEUE_EXIT_TIMEOUT']):
+            self.app.logger.error('Shutting down with %d messages still unsent', self.stats()['pending'])
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending
+        stats['depth'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
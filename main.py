@@ -1,48 +1,126 @@
-import os
-from dotenv import load_dotenv
+import re
+import json
+import hashlib
+import click
+import time
+from collections import namedtuple
 #import Flask library and SQLAlchemy that support Flask into the program
-from flask_bcrypt import Bcrypt
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, session, flash, abort, g, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_mail import Mail, Message # <--- NEW
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import IntegrityError
+from werkzeug.local import LocalProxy
 from itsdangerous import URLSafeTimedSerializer # <--- NEW for tokens
-from datetime import datetime
-
-# 3. Load the variables from the .env file
-load_dotenv()
-
-
-# Create an instance of the Flask class
-app = Flask(__name__) # Needed for session management and flash messages
-app.secret_key = os.getenv('SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DB_URI')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Email Config
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME') # <--- Secure!
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-mail = Mail(app)
-# 3. Serializer for Tokens
-# We use the same secret key as the app to sign the tokens
-serializer = URLSafeTimedSerializer(app.secret_key)
-
-# --- DATABASE CONFIGURATION ---
-# This is the code that tells SQLAlchemy where our database is.
-# Format: mysql+pymysql://<username>:<password>@<host>/<database_name>
-# For XAMPP default: username is 'root', there is no password, host is 'localhost', and the project's database 'dofe_project'
-# app.config[] can be understand as a dictionary that hold all the configuration setting for Flask app
-app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql+pymysql://root:@localhost/dofe_project'
-# URI stand for Uniform Resource Identifier - essentially the "address" of your database.
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-# Disable unwanted feature of SQLAlchemy that isn't needed for this project
-db = SQLAlchemy(app)
-# Creates the actual instance of the SQLAlchemy translator and links it directly to the Flask app. This 'database' object is now your primary tool for all database operations.
-
-bcrypt = Bcrypt(app)
+from datetime import datetime, timedelta
+from config import get_config
+from content_versions import ContentVersions
+from page_cache import PageCache, MemoryBackend
+from mail_queue import MailQueue
+from password_hasher import PasswordHasher, RateLimiter, HashingBusy
+from search_index import SearchIndex
+from request_metrics import RequestMetrics
+from database import RoutingSession, configure_database, read_only, primary_reads, pool_stats
+from response_optimizer import ResponseOptimizer, optimize
+from post_summary import make_excerpt, newest_post_date
+import bulk_io
+import post_summary
+
+# --- EXTENSIONS ---
+# Importing this file is cheap and has no side effects: nothing connects to MySQL, no mail server is configured
+# and no process pool is started until something actually needs it. (All the settings live in config.py.)
+# This 'db' object is our primary tool for all database operations. It is connected to an app in create_app().
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Every other extension keeps its own state (workers, pools, caches) PER APP, so create_app() builds a fresh
+# one for each app and stores it in app.extensions. The names below always point at the extension of the app
+# that is handling the current request (current_app), so the views can simply use e.g. password_hasher.hash().
+def app_extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+# Emails are sent in the background by worker threads (see mail_queue.py)
+mail_queue = app_extension('mail_queue')
+# All password hashing/checking goes through this service (see password_hasher.py), which runs scrypt in a
+# process pool and refuses new work with a 503 when too much is already waiting.
+password_hasher = app_extension('password_hasher')
+# Rendered HTML for the home feed and profile pages (see page_cache.py)
+page_cache = app_extension('page_cache')
+# An in-memory index of every post's words (see search_index.py), saved to a file between restarts
+search_index = app_extension('search_index')
+# Counts queries, DB time and render time for every request and serves them at /metrics (see request_metrics.py)
+metrics = app_extension('request_metrics')
+# gzip/brotli compression, ETags + 304 for HTML pages, and long caching for static files (see response_optimizer.py)
+response_optimizer = app_extension('response_optimizer')
+
+# Every page of the site is registered on this blueprint, and create_app() attaches it to the app.
+# cli_group=None keeps the commands at the top level ("flask export", not "flask main export").
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+# --- APP FACTORY ---
+# Builds a new, fully configured app. config is 'development', 'testing', 'production' or a config class;
+# without one, the APP_CONFIG environment variable decides (see config.py).
+# "flask --app main run" finds this function on its own.
+def create_app(config=None):
+    # Create an instance of the Flask class
+    app = Flask(__name__)
+    app.config.from_object(get_config(config))
+
+    # DB_URI can point the app at MySQL, or at a local SQLite file for benchmarks/tests
+    configure_database(app, app.config['DB_URI'], app.config['DB_REPLICA_URIS'])
+    db.init_app(app)
+    MailQueue(app)
+    PasswordHasher(app)
+    PageCache(app, content_versions) # (its generations are kept in the database, see page_cache.py)
+    SearchIndex(app) # (saves itself at exit, see search_index.py)
+    RequestMetrics(app).add_collector(service_stats)
+    ResponseOptimizer(app)
+
+    # Token buckets limit password attempts per IP address (and per username for logins)
+    app.extensions['ip_limiter'] = RateLimiter(rate=app.config['RATE_LIMIT_PER_SECOND'], burst=app.config['RATE_LIMIT_BURST'])
+    app.extensions['username_limiter'] = RateLimiter(rate=app.config['RATE_LIMIT_PER_SECOND'], burst=app.config['RATE_LIMIT_BURST'])
+    # Logged-in user records (see get_current_user() below)
+    app.extensions['user_cache'] = MemoryBackend(max_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+                                                 ttl=app.config['USER_CACHE_TTL'])
+
+    app.register_blueprint(bp)
+    return app
+
+def get_serializer():
+    # Serializer for password reset tokens. It signs the tokens with the same secret key as the app,
+    # and is only built when a token is actually made or checked.
+    return URLSafeTimedSerializer(current_app.secret_key)
+
+def check_rate_limit(username=None):
+    # 429 means "Too Many Requests"
+    if not current_app.extensions['ip_limiter'].allow(request.remote_addr):
+        abort(429)
+    if username is not None and not current_app.extensions['username_limiter'].allow(username):
+        abort(429)
+
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    # 503 means "Service Unavailable". Retry-After tells the browser/client when to try again.
+    return "The server is busy right now. Please try again in a moment.", 503, {'Retry-After': '1'}
+
+# Also export the numbers our background services already keep.
+# Most of them only ever go up (messages sent, seconds spent hashing...), so they are counters, whose names
+# end in _total (Prometheus' rate() needs that). Only these few are the CURRENT level of something (gauges):
+SERVICE_GAUGES = {'pending', 'depth', 'max_queue_wait_seconds'}
+
+def service_stats():
+    stats = []
+    for prefix, description, service in (('mail_queue', 'Mail queue', mail_queue),
+                                         ('password_hash', 'Password hashing', password_hasher),
+                                         ('response', 'Response optimisation', response_optimizer)):
+        for name, value in service.stats().items():
+            if name in SERVICE_GAUGES:
+                stats.append((f'{prefix}_{name}', 'gauge', f'{description}: {name}.', value))
+            else:
+                stats.append((f'{prefix}_{name}_total', 'counter', f'{description}: {name}.', value))
+    return stats + pool_stats(db)
+
+# A DATETIME that keeps microseconds on MySQL too (a plain DATETIME there only stores whole seconds)
+PRECISE_DATETIME = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
 
 # Create a python class named 'User'. This 'User' class will inherits from database.Model, which is a base class that is provided by Flask-SQLAlchemy
 # Essentially give the User class all the database powes
@@ -60,7 +138,10 @@ class User(db.Model):
     # db.String(<number>) means the data type of this column is String with maximum length of <number> characters
     email = db.Column(db.String(120), unique = True, nullable = False)
     password_hash = db.Column(db.String(255), nullable = False)
-
+    # Kept up to date by create_post/delete_post, so showing "N posts" never needs a COUNT query
+    # (server_default lets "flask backfill-post-summaries" add the column to an existing table)
+    post_count = db.Column(db.Integer, nullable = False, default = 0, server_default = '0')
+    last_posted_at = db.Column(db.DateTime) # empty until the user's first post
 
     posts = db.relationship('Post', backref='author', lazy=True)
 
@@ -74,31 +155,194 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     content = db.Column(db.Text, nullable=False) # 'Text' is for long paragraphs
+    # A short plain-text version of content for the feed/profile/search lists (see post_summary.py).
+    # Empty for old posts until "flask backfill-post-summaries" has been run.
+    excerpt = db.Column(db.String(255))
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Set on every INSERT and UPDATE of the row. The search index snapshot uses it to spot edited posts
+    # (see search_index.py), so it keeps microseconds on MySQL too.
+    # Empty for old posts until "flask backfill-post-summaries" has been run.
+    updated_at = db.Column(PRECISE_DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
+    # A composite index on (date_posted, id) lets the database walk the feed in
+    # "newest first" order without sorting the whole table on every request.
+    # The second one does the same for a profile page (one user's posts), and also answers
+    # "this user's newest post" for the post counters without reading all of their posts.
+    # "flask backfill-post-summaries" adds any that are missing to an existing database.
+    __table_args__ = (db.Index('ix_post_date_posted_id', 'date_posted', 'id'),
+                      db.Index('ix_post_user_id_date_posted_id', 'user_id', 'date_posted', 'id'))
+
     def __repr__(self):
         return f'<Post {self.title}>'
 
+# One row per version counter (see content_versions.py)
+class ContentVersion(db.Model):
+    __tablename__ = 'content_versions'
+    name = db.Column(db.String(100), primary_key=True) # e.g. 'posts'
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(PRECISE_DATETIME, nullable=False)
+
+content_versions = ContentVersions(db, ContentVersion)
+
+# --- CURRENT USER ---
+# Almost every page needs the logged-in user. Instead of every view running its own User.query.get(),
+# get_current_user() loads it ONCE per request (remembered on flask.g) and also keeps a small copy of the
+# user in memory across requests, so most page views don't hit the database for it at all.
+# The cached copy is a plain read-only record, not a database object - views that CHANGE the user load it properly.
+# forget_cached_user() only reaches the cache of THIS worker process: the others may show the old name or email
+# for up to USER_CACHE_TTL seconds. That is fine for the navbar, so nothing that writes may rely on the copy.
+CurrentUser = namedtuple('CurrentUser', ['id', 'username', 'email'])
+
+def get_current_user():
+    if 'user_id' not in session:
+        return None
+    if 'current_user' not in g:
+        user_id = session['user_id']
+        user_cache = current_app.extensions['user_cache']
+        user = user_cache.get(user_id)
+        if user is None:
+            # Just the three columns, not a User object: that could be a partly loaded author from a post list
+            row = db.session.execute(db.select(User.id, User.username, User.email).where(User.id == user_id)).first()
+            # The account may have been deleted while the user was still logged in
+            user = CurrentUser(*row) if row else None
+            if user:
+                user_cache.set(user_id, user)
+        g.current_user = user
+    return g.current_user
+
+def forget_cached_user(user_id):
+    # Call after changing a user, so the next request loads the new details
+    current_app.extensions['user_cache'].delete(user_id)
+    g.pop('current_user', None)
+
+# Makes 'current_user' available in every template (layout.html uses it for the navbar)
+@bp.app_context_processor
+def inject_current_user():
+    return {'current_user': get_current_user()}
+
+# --- PAGINATION HELPERS ---
+# How many posts we show on a single page of the feed
+POSTS_PER_PAGE = 10
+
+# We use "keyset" (cursor) pagination instead of OFFSET.
+# The cursor is the (date_posted, id) of the last post on the current page, e.g. ?before=2024-01-31T10:15:00.123456,42
+# The next page simply asks for posts that are OLDER than that cursor, so the database can jump straight to it using the index
+def format_cursor(post):
+    return f'{post.date_posted.isoformat()},{post.id}'
+
+def parse_cursor(value):
+    # No cursor means "start from the newest post"
+    if not value:
+        return None
+    try:
+        timestamp, post_id = value.rsplit(',', 1)
+        return datetime.fromisoformat(timestamp), int(post_id)
+    except ValueError:
+        abort(400) # 400 means "Bad Request" - the cursor in the URL is broken
+
+def apply_cursor(query):
+    # Sorts newest first and skips everything up to the ?before= cursor
+    cursor = parse_cursor(request.args.get('before'))
+    if cursor:
+        date_posted, post_id = cursor
+        # "Older than the cursor": an earlier date, or the same date with a smaller id (tie-breaker)
+        query = query.filter(db.or_(Post.date_posted < date_posted,
+                                    db.and_(Post.date_posted == date_posted, Post.id < post_id)))
+    return query.order_by(Post.date_posted.desc(), Post.id.desc())
+
+def paginate_posts(query):
+    # Returns (posts, next_cursor). next_cursor is None when there are no older posts.
+    # Ask for one extra row so we know whether another page exists
+    posts = apply_cursor(query).limit(POSTS_PER_PAGE + 1).all()
+    next_cursor = None
+    if len(posts) > POSTS_PER_PAGE:
+        posts = posts[:POSTS_PER_PAGE]
+        next_cursor = format_cursor(posts[-1])
+    return posts, next_cursor
+
+# Lists of posts only show the title, the excerpt and the author - never the full (possibly huge) content.
+# load_only() leaves the other columns out of the SELECT, and raiseload=True turns any accidental use of
+# post.content in a list template into an error instead of one hidden extra query per post.
+POST_LIST_COLUMNS = (Post.id, Post.title, Post.excerpt, Post.date_posted, Post.user_id)
+
+def post_list_query():
+    # joinedload fetches each post's author in the SAME query (a JOIN),
+    # instead of one extra query per post when the template reads post.author.
+    # The author only gets the columns the list shows; reading any other one (e.g. the email) raises.
+    return Post.query.options(db.load_only(*POST_LIST_COLUMNS, raiseload=True),
+                              db.joinedload(Post.author).load_only(User.id, User.username, User.post_count,
+                                                                   raiseload=True))
+
+# The cached post list contains a marker like <!--post-actions:5:2--> (post id 5, author id 2) for every post.
+# We replace it per request, so the Edit/Delete buttons only appear for the owner and never end up in the shared cache.
+POST_ACTIONS_MARKER = re.compile(r'<!--post-actions:(\d+):(\d+)-->')
+
+def add_post_actions(html, user):
+    def replace(match):
+        post_id, author_id = int(match.group(1)), int(match.group(2))
+        if user and user.id == author_id:
+            return render_template('post_actions.html', post_id=post_id)
+        return ''
+    return POST_ACTIONS_MARKER.sub(replace, html)
+
+# Called BEFORE a write commits: the cached feed/profile pages and the API's version change in the same transaction
+# as the posts, so no worker serves the old pages once the change is visible
+def posts_changed(*usernames):
+    page_cache.invalidate('home', *[f'profile:{username}' for username in usernames])
+    content_versions.bump('posts')
+
+def author_name(user_id):
+    # Write paths take the author's name from the database, never from get_current_user(): after a rename,
+    # other workers keep the old name cached for up to USER_CACHE_TTL seconds and would drop the wrong profile page.
+    # FOR UPDATE waits for a rename of this user that hasn't committed yet, and then reads the new name.
+    return db.session.execute(db.select(User.username).where(User.id == user_id).with_for_update()).scalar_one()
+
+def all_posts_changed():
+    # e.g. after an import: every cached page may be out of date
+    page_cache.clear()
+    content_versions.bump('posts')
+
+# --- PER-USER COUNTERS ---
+# Called in the SAME transaction as the post change (before commit), so the counters can never disagree
+# with the posts table. The arithmetic happens IN the database (post_count = post_count + 1), so two posts
+# created at the same moment are both counted.
+def post_added(user_id, date_posted):
+    db.session.execute(db.update(User).where(User.id == user_id)
+                       .values(post_count=User.post_count + 1, last_posted_at=date_posted),
+                       execution_options={'synchronize_session': False})
+
+def post_removed(user_id):
+    # Run after the DELETE has been flushed, so the deleted post no longer counts as the newest one
+    db.session.execute(db.update(User).where(User.id == user_id)
+                       .values(post_count=User.post_count - 1, last_posted_at=newest_post_date(Post, user_id)),
+                       execution_options={'synchronize_session': False})
+
 # --- ROUTES ---
 # define a route for the home page
-@app.route('/')
+@bp.route('/')
+@read_only
 def home():
-    posts = Post.query.all() 
-    users = User.query.all() # Get all users
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        return render_template('home.html', posts=posts, user=user)
-    else:
-        return render_template('home.html', posts=posts, user=None)
+    # A cache miss is rendered from the PRIMARY. The cache generation may come from a replica that is already
+    # up to date while the render would go to one that is still behind - and then old posts would be cached
+    # under the new generation until the next write. The primary is never behind, and most views are cache hits.
+    @primary_reads()
+    def render_posts():
+        posts, next_cursor = paginate_posts(post_list_query())
+        return render_template('post_list.html', posts=posts, next_cursor=next_cursor)
+
+    # The post list is the same for everyone, so it is served from the cache (one entry per page)
+    posts_html = page_cache.fetch('home', request.args.get('before', ''), render_posts)
+    user = get_current_user()
+    return render_template('home.html', posts_html=add_post_actions(posts_html, user), user=user)
     
 
-@app.route('/create', methods=['GET', 'POST'])
+@bp.route('/create', methods=['GET', 'POST'])
 def create_post():
     # 1. SECURITY CHECK: Is the user logged in?
     if 'user_id' not in session:
         flash("You must be logged in to create a post.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     if request.method == 'POST':
         title = request.form.get('title')
@@ -107,54 +351,64 @@ def create_post():
         # 2. Get the current user's ID from the session
         current_user_id = session['user_id']
 
-        # 3. Create the Post, assigning the Foreign Key (user_id)
-        new_post = Post(title=title, content=content, user_id=current_user_id)
+        # 3. Create the Post, assigning the Foreign Key (user_id), with its short excerpt for the post lists
+        new_post = Post(title=title, content=content, excerpt=make_excerpt(content), user_id=current_user_id,
+                        date_posted=datetime.utcnow())
         
         db.session.add(new_post)
+        # 4. Count it on the author in the same transaction (and drop the cached pages that list it)
+        post_added(current_user_id, new_post.date_posted)
+        posts_changed(author_name(current_user_id))
         db.session.commit()
+        search_index.add(Post, new_post)
         
         flash("Post created successfully!", "success")
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     return render_template('create_post.html')
 
 # A new route to test our database connection
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     # If user is already logged in, redirect to home
     if 'user_id' in session:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
 
+        # Stop password guessing (and hashing floods) before doing any work
+        check_rate_limit(username)
+
         # Query the database for a user with the provided username
         user = User.query.filter_by(username=username).first()
 
-        # check_password_hash takes two arguments:
-        # 1. The HASH stored in the database (user.password_hash)
+        # check_and_upgrade takes two arguments:
+        # 1. The user, whose HASH is stored in the database (user.password_hash)
         # 2. The PLAIN password the user just typed (password)
-        # It handles the un-mashing and comparison securely behind the scenes
-        if user and check_password_hash(user.password_hash, password):
+        # It handles the un-mashing and comparison securely behind the scenes,
+        # and re-hashes the password if it was stored with older/weaker settings
+        if user and password_hasher.check_and_upgrade(user, password):
+            db.session.commit() # saves the upgraded hash, if there is one
             # Store user ID in session to keep the user logged in
             session['user_id'] = user.id
             flash("Logged in successfully!", "success")
-            return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
         else:
             flash("Invalid username or password.", "error")
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     # Remove user ID from session to log the user out
     session.pop('user_id', None)
     flash("You have been logged out.", "success")
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -165,44 +419,47 @@ def register():
         #if password is less than 8 characters, flash error message and redirect back to register page
         if len(password) < 8:
             flash("Password must be at least 8 characters long!", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         #if password does not contain at least one number, flash error message and redirect back to register page
         if not any(char.isdigit() for char in password):
             flash("Password must contain at least one number!", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         #if password does not contain at least one uppercase letter, flash error message and redirect back to register page
         if not any(char.isupper() for char in password):
             flash("Password must contain at least one uppercase letter!", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         #if password does not contain at least one special character, flash error message and redirect back to register page
         special_characters = "!@#$%^&*()-+?_=,<>/"
         if not any(char in special_characters for char in password):
             flash("Password must contain at least one special character!", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
 
+        check_rate_limit()
+
         # Check if the username or email already exists
         existing_user = User.query.filter((User.username == username) | (User.email == email)).first()
         if existing_user:
             flash("User with that name already exist!", "error")
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         # Create a new user instance
         #new_user = User(username=username, email=email, password_hash=password) <- Insecure way
         # Secure way: Hash the password before storing it
-        hashed_password = generate_password_hash(password, method='scrypt')
+        hashed_password = password_hasher.hash(password)
         
         new_user = User(username=username, email=email, password_hash=hashed_password)
         db.session.add(new_user)
         db.session.commit()
         flash("Account created successfully! You will now be redirected to login page...", "success")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html')
 
 
 
 
-@app.route('/testdb')
+@bp.route('/testdb')
+@optimize(compress=False, etag=False) # a diagnostic page: always send it in full
 def test_db_connection():
     try:
         # This is how you query the database with SQLAlchemy
@@ -218,8 +475,19 @@ def test_db_connection():
         # If there is any error, display the error message
         return f'<h1>Error!</h1><p>There was an error connecting to the database: {e}</p>'
 
-# --- UPDATE POST ROUTE ---    
-@app.route('/post/<int:post_id>/update', methods=['GET', 'POST'])
+# --- SINGLE POST PAGE ---
+# The lists only show an excerpt, so this is the one page that loads a post's full content
+@bp.route('/post/<int:post_id>')
+@read_only
+def post_detail(post_id):
+    post = Post.query.options(db.joinedload(Post.author)).filter_by(id=post_id).first_or_404()
+    user = get_current_user()
+    # Only the author gets the Edit/Delete buttons
+    can_edit = user is not None and user.id == post.user_id
+    return render_template('post.html', post=post, post_id=post.id, can_edit=can_edit)
+
+# --- UPDATE POST ROUTE ---
+@bp.route('/post/<int:post_id>/update', methods=['GET', 'POST'])
 def update_post(post_id):
     # 1. Fetch the post from the DB by ID. 
     # If it doesn't exist, return a 404 error automatically.
@@ -227,49 +495,59 @@ def update_post(post_id):
 
     # 2. CHECK AUTHORIZATION
     # Is the user logged in? AND Is the logged-in user the author?
-    if 'user_id' not in session or post.author.id != session['user_id']:
+    # (post.user_id is already loaded, so comparing IDs doesn't need to load the author)
+    if 'user_id' not in session or post.user_id != session['user_id']:
         abort(403) # 403 means "Forbidden" - You don't have permission.
     
     if request.method == 'POST':
         # 3. Update the post data
         post.title = request.form.get('title')
         post.content = request.form.get('content')
+        post.excerpt = make_excerpt(post.content)
         
         # 4. Commit changes (No need to db.session.add() for updates)
+        posts_changed(author_name(post.user_id))
         db.session.commit()
+        search_index.add(Post, post)
     
         flash('Your post has been updated!', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     return render_template('update_post.html', post=post)
 
 # --- DELETE POST ROUTE ---
-@app.route('/post/<int:post_id>/delete', methods=['POST'])
+@bp.route('/post/<int:post_id>/delete', methods=['POST'])
 def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
 
     # 1. CHECK AUTHORIZATION (Crucial!)
-    if 'user_id' not in session or post.author.id != session['user_id']:
+    if 'user_id' not in session or post.user_id != session['user_id']:
         abort(403)
     
-    # 2. Delete the post
+    # 2. Delete the post, and take it off the author's counters in the same transaction
     db.session.delete(post)
+    db.session.flush()
+    post_removed(post.user_id)
+    posts_changed(author_name(post.user_id))
     db.session.commit()
+    search_index.remove(Post, post_id)
     
     flash('Your post has been deleted!', 'success')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/account', methods=['GET', 'POST'])
+@bp.route('/account', methods=['GET', 'POST'])
+@read_only
 def account():
     # SECURITY CHECK: Is the user logged in?
     if 'user_id' not in session:
         flash("You must be logged in to view your account.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     user_id = session['user_id']
-    current_user = User.query.get(user_id)
 
     if request.method == 'POST':
+        # We are changing the user, so load the real database row (not the cached copy)
+        current_user = User.query.get(user_id)
         new_email = request.form.get('email')
         new_username = request.form.get('username')
 
@@ -279,32 +557,174 @@ def account():
             existing_user = User.query.filter_by(username=new_username).first()
             if existing_user:
                 flash("Username already taken. Please choose a different one.", "error")
-                return redirect(url_for('account')) 
+                return redirect(url_for('main.account')) 
 
         # 3. Update user information
+        old_username = current_user.username
         current_user.email = new_email
         current_user.username = new_username
+        # The username is shown on the feed and profile pages (and in the API), so drop those cached pages too
+        posts_changed(old_username, new_username)
         db.session.commit()
+        forget_cached_user(user_id)
 
         flash("Your account has been updated!", "success")
-        return redirect(url_for('account'))
-    return render_template('account.html', current_user=current_user)
+        return redirect(url_for('main.account'))
+    return render_template('account.html', current_user=get_current_user())
 
-@app.route('/user/<string:username>')
+@bp.route('/user/<string:username>')
+@read_only
 def user_profile(username):
-    # 1. Find the user by name. If they don't exist, show 404 error.
+    @primary_reads() # (see home)
+    def render_profile():
+        # 1. Find the user by name. If they don't exist, show 404 error.
+        user = User.query.filter_by(username=username).first_or_404()
+
+        # 2. Get one page of posts by this user (we already know the author, so no join is needed)
+        # The post count comes from user.post_count, so there is no COUNT(*) query any more
+        posts, next_cursor = paginate_posts(Post.query.options(db.load_only(*POST_LIST_COLUMNS, raiseload=True))
+                                            .filter_by(user_id=user.id))
+        return render_template('profile_posts.html', user=user, posts=posts, next_cursor=next_cursor)
+
+    profile_html = page_cache.fetch(f'profile:{username}', request.args.get('before', ''), render_profile)
+    # (the navbar gets the logged-in user from get_current_user() through the context processor)
+    return render_template('user_posts.html', profile_html=profile_html)
+
+@bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        abort(400)
+
+    # 1. Ask the search index which posts match (best matches first)
+    post_ids, total = search_index.search(Post, query, page=page, per_page=POSTS_PER_PAGE)
+
+    # 2. Load just those posts (and their authors) in one query, then put them back in ranking order
+    posts_by_id = {post.id: post for post in post_list_query().filter(Post.id.in_(post_ids))}
+    posts = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+
+    user = get_current_user()
+    posts_html = add_post_actions(render_template('post_list.html', posts=posts, next_cursor=None), user)
+    has_next = page * POSTS_PER_PAGE < total
+    return render_template('search.html', query=query, posts_html=posts_html, total=total, page=page, has_next=has_next)
+
+# --- JSON API ---
+# Read-only API for other programs, so they don't have to scrape the HTML pages.
+#   /api/posts                          newest posts first, as JSON: {"posts": [...], "next_cursor": "..."}
+#   /api/users/<username>/posts         the same, for one user
+# Options (query string):
+#   ?before=<cursor>       next page (use next_cursor from the previous response)
+#   ?limit=50              posts per page (max API_MAX_LIMIT)
+#   ?fields=id,title       only return these fields
+#   ?format=ndjson         one JSON object per line ("newline delimited JSON") - for bulk export.
+#                          Without ?limit this streams EVERY post. To resume, use "<date_posted>,<id>" of the last line as ?before=.
+# Responses are streamed row by row from a server-side cursor, so even a full export never sits in memory.
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 1000
+API_FIELDS = {
+    'id': Post.id,
+    'title': Post.title,
+    'content': Post.content,
+    'excerpt': Post.excerpt,
+    'date_posted': Post.date_posted,
+    'user_id': Post.user_id,
+    'author': User.username,
+}
+
+def api_options():
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',')] if fields else list(API_FIELDS)
+    if any(field not in API_FIELDS for field in fields):
+        abort(400)
+    ndjson = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+    if ndjson:
+        # The cursor fields are always included, so an export can be resumed
+        fields = list(dict.fromkeys(['id', 'date_posted'] + fields))
+    limit = request.args.get('limit', None if ndjson else API_DEFAULT_LIMIT, type=int)
+    if limit is not None and not 1 <= limit <= API_MAX_LIMIT:
+        abort(400)
+    return fields, limit, ndjson
+
+def api_row(columns, fields, row):
+    data = dict(zip(columns, row))
+    data['date_posted'] = data['date_posted'].isoformat()
+    return {field: data[field] for field in fields}
+
+def api_posts_response(query):
+    fields, limit, ndjson = api_options()
+
+    # 1. Conditional GET. The validators come from the 'posts' version (one primary-key lookup, see content_versions.py),
+    # which every post create/edit/delete and every username change bumps in its own transaction.
+    # So all workers agree on them, and a 304 never needs to look at the posts themselves.
+    version, changed_at = content_versions.get('posts')
+    fingerprint = f'{version}|{request.full_path}|{ndjson}'
+    etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+    # HTTP dates only have whole seconds, so Last-Modified is only sent once the last change is more than a second old.
+    # Any later change then falls in a later second, and If-Modified-Since can never hide it.
+    last_modified = None
+    if changed_at and changed_at < datetime.utcnow() - timedelta(seconds=1):
+        last_modified = changed_at.replace(microsecond=0)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(last_modified and request.if_modified_since
+                            and request.if_modified_since.replace(tzinfo=None) >= last_modified)
+    if not_modified:
+        response = Response(status=304)
+    else:
+        # 2. Only select the columns that were asked for (plus id/date_posted for the cursor),
+        # and only join users when the author name is wanted
+        columns = list(dict.fromkeys(['id', 'date_posted'] + fields))
+        rows = apply_cursor(query.with_entities(*[API_FIELDS[column] for column in columns]))
+        if 'author' in fields:
+            rows = rows.join(User, User.id == Post.user_id)
+        if limit is not None:
+            rows = rows.limit(limit + 1) # one extra row tells us if there is a next page
+        # yield_per streams rows from a server-side cursor in chunks instead of loading them all
+        rows = rows.yield_per(500)
+
+        if ndjson:
+            def generate():
+                for number, row in enumerate(rows):
+                    if limit is not None and number == limit:
+                        break
+                    yield json.dumps(api_row(columns, fields, row)) + '\n'
+            response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        else:
+            def generate():
+                yield '{"posts": ['
+                previous = None
+                for number, row in enumerate(rows):
+                    if number == limit:
+                        # There is at least one more post, so point to the next page
+                        cursor = f'{previous.date_posted.isoformat()},{previous.id}'
+                        yield f'], "next_cursor": {json.dumps(cursor)}}}'
+                        return
+                    yield (', ' if number else '') + json.dumps(api_row(columns, fields, row))
+                    previous = row
+                yield '], "next_cursor": null}'
+            response = Response(stream_with_context(generate()), mimetype='application/json')
+
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # Clients may keep the response but must check with us (cheaply, thanks to the ETag) before reusing it
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/posts')
+@read_only
+def api_posts():
+    return api_posts_response(Post.query)
+
+@bp.route('/api/users/<string:username>/posts')
+@read_only
+def api_user_posts(username):
     user = User.query.filter_by(username=username).first_or_404()
+    return api_posts_response(Post.query.filter(Post.user_id == user.id))
 
-    # 2. Get all posts by this user
-    posts = user.posts 
-    
-    # check if *I* am logged in (for the navbar)
-    current_user = None
-    if 'user_id' in session:
-        current_user = User.query.get(session['user_id'])
-    return render_template('user_posts.html', user=user, posts=posts, current_user=current_user)
-
-@app.route('/reset_password', methods=['GET', 'POST'])
+@bp.route('/reset_password', methods=['GET', 'POST'])
 def reset_request():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -312,32 +732,34 @@ def reset_request():
         
         if user:
             # Generate a secure token valid for 1800 seconds (30 mins)
-            token = serializer.dumps(user.email, salt='password-reset-salt')
+            token = get_serializer().dumps(user.email, salt='password-reset-salt')
             
             # Create the link
-            link = url_for('reset_token', token=token, _external=True)
+            link = url_for('main.reset_token', token=token, _external=True)
             
-            # Send the email
+            # Queue the email - a background worker sends it, so this request doesn't wait for the mail server
+            # (flask_mail is only imported here, so workers that never send mail never load it)
+            from flask_mail import Message
             msg = Message('Password Reset Request', sender='teppitareal@gmail.com', recipients=[user.email])
             msg.body = f'Your link is: {link}. It expires in 30 minutes.'
-            mail.send(msg)
+            mail_queue.enqueue(msg)
             
         # Security Best Practice: Always say "If that email exists, we sent a link."
         # Don't reveal if the email is actually in the DB or not!
         flash('If an account exists with that email, a reset link has been sent.', 'info')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
         
     return render_template('reset_request.html')
 
-@app.route('/reset_password/<token>', methods=['GET', 'POST'])
+@bp.route('/reset_password/<token>', methods=['GET', 'POST'])
 def reset_token(token):
     try:
         # Try to decode the token. 
         # max_age=1800 ensures it fails if link is > 30 mins old
-        email = serializer.loads(token, salt='password-reset-salt', max_age=1800)
+        email = get_serializer().loads(token, salt='password-reset-salt', max_age=1800)
     except:
         flash('The reset link is invalid or has expired.', 'error')
-        return redirect(url_for('reset_request'))
+        return redirect(url_for('main.reset_request'))
     
     if request.method == 'POST':
         password = request.form.get('password')
@@ -349,24 +771,126 @@ def reset_token(token):
         if password != confirm_password:
             flash('Passwords do not match! Please try again.', 'error')
             # Important: Redirect back to the SAME page so they can try again
-            return redirect(url_for('reset_token', token=token))
+            return redirect(url_for('main.reset_token', token=token))
         
-        if check_password_hash(user.password_hash, password):
+        check_rate_limit()
+
+        if password_hasher.check(user.password_hash, password):
             flash('Your new password cannot be the same as your old password.', 'error')
-            return redirect(url_for('reset_token', token=token))
+            return redirect(url_for('main.reset_token', token=token))
 
-        hashed_password = generate_password_hash(password, method='scrypt')
+        hashed_password = password_hasher.hash(password)
         user.password_hash = hashed_password
         db.session.commit()
+        forget_cached_user(user.id)
         
         flash('Your password has been updated! You can now log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
         
     return render_template('reset_token.html')
 
+# --- COMMAND LINE COMMANDS ---
+# Run with: flask --app main rebuild-search-index
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Re-index every post and save the search index snapshot."""
+    count = search_index.rebuild(Post)
+    search_index.save(merge=False)
+    click.echo(f'Indexed {count} posts into {search_index.path}')
+
+# Run with: flask --app main export backup.ndjson
+#       or: flask --app main export users.csv --format csv --type user
+@bp.cli.command('export')
+@click.argument('output', type=click.File('w', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+@click.option('--type', 'row_type', type=click.Choice(['user', 'post', 'all']), default='all',
+              help='What to export (CSV files hold a single type).')
+def export_data(output, file_format, row_type):
+    """Stream users and/or posts to an NDJSON or CSV file ('-' for stdout)."""
+    if file_format == 'csv' and row_type == 'all':
+        raise click.UsageError('CSV export needs --type user or --type post')
+    types = ('user', 'post') if row_type == 'all' else (row_type,)
+    started = time.perf_counter()
+    rows = bulk_io.export_rows(User, Post, types)
+    count = bulk_io.write_csv(rows, output, row_type) if file_format == 'csv' else bulk_io.write_ndjson(rows, output)
+    elapsed = time.perf_counter() - started
+    click.echo(f'Exported {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s)', err=True)
+
+# Run with: flask --app main import backup.ndjson --upsert
+@bp.cli.command('import')
+@click.argument('input_file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'file_format', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+@click.option('--type', 'row_type', type=click.Choice(['user', 'post']), help='Type of the rows in a CSV file.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per INSERT statement.')
+@click.option('--commit-every', default=10000, show_default=True, help='Rows per transaction.')
+@click.option('--upsert', is_flag=True, help='Update users/posts that already exist instead of skipping them.')
+def import_data(input_file, file_format, row_type, batch_size, commit_every, upsert):
+    """Load users and posts from an NDJSON or CSV file in batches."""
+    if file_format == 'csv' and not row_type:
+        raise click.UsageError('CSV import needs --type user or --type post')
+    rows = bulk_io.read_csv(input_file, row_type) if file_format == 'csv' else bulk_io.read_ndjson(input_file)
+    # Imported posts (and renamed users) change the cached pages and what the API returns
+    importer = bulk_io.Importer(db, User, Post, batch_size=batch_size, commit_every=commit_every, upsert=upsert,
+                                before_commit=all_posts_changed)
+    try:
+        for number, (kind, row) in enumerate(rows, start=1):
+            importer.add(kind, row)
+            if number % 100000 == 0:
+                click.echo(f'{number} rows read ({importer.rows_per_second():.0f} rows/s)', err=True)
+        stats = importer.finish()
+    except ValueError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    except IntegrityError as e:
+        # e.g. two users in the file with the same email but different usernames
+        db.session.rollback()
+        raise click.ClickException(f'the database refused a row: {e.orig}')
+    click.echo(f"Inserted {stats['inserted']}, updated {stats['updated']}, skipped {stats['skipped']} "
+               f"({importer.rows_per_second():.0f} rows/s)", err=True)
+    click.echo('Run "flask rebuild-search-index" so the imported posts can be searched.', err=True)
+
+# Run once after upgrading: flask --app main backfill-post-summaries
+# Adds the content_versions table and the excerpt/updated_at/post_count/last_posted_at columns if they don't exist yet,
+# then fills them in.
+# Safe to stop and re-run: every batch is committed, and posts that already have an excerpt are skipped.
+@bp.cli.command('backfill-post-summaries')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per UPDATE statement and transaction.')
+@click.option('--all', 'everything', is_flag=True, help='Recalculate every excerpt, not only the missing ones.')
+def backfill_post_summaries(batch_size, everything):
+    """Fill in post excerpts and per-user post counters in batches."""
+    db.create_all(bind_key=None) # only creates tables that don't exist yet (e.g. content_versions)
+    added = post_summary.add_missing_columns(db, Post, ['excerpt', 'updated_at']) + \
+        post_summary.add_missing_columns(db, User, ['post_count', 'last_posted_at'])
+    if added:
+        click.echo(f'Added columns: {", ".join(added)}', err=True)
+    added = post_summary.add_missing_indexes(db, Post)
+    if added:
+        click.echo(f'Added indexes: {", ".join(added)}', err=True)
+
+    started = time.perf_counter()
+    posts = users = dated = 0
+    for dated in post_summary.backfill_updated_at(db, Post, batch_size=batch_size):
+        pass
+    report_at = 100000
+    for posts in post_summary.backfill_excerpts(db, Post, batch_size=batch_size, everything=everything):
+        if posts >= report_at:
+            click.echo(f'{posts} excerpts written', err=True)
+            report_at += 100000
+    # Counters are always recalculated for everyone, which also repairs any that have drifted
+    report_at = 100000
+    for users in post_summary.backfill_user_counters(db, User, Post, batch_size=batch_size):
+        if users >= report_at:
+            click.echo(f'{users} users recounted', err=True)
+            report_at += 100000
+    # The cached pages and API responses still show the old (missing) excerpts and counts
+    all_posts_changed()
+    db.session.commit()
+    click.echo(f'Dated {dated} posts, wrote {posts} excerpts and recounted {users} users '
+               f'in {time.perf_counter() - started:.1f}s', err=True)
+
 # --- RUN THE APP ---
 # like last time, this code check if it is being run directly (not imported as a module in another script)
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app('development').run(debug=True)
 
 
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+# --- RENDERED PAGE CACHE ---
+# Rendering the home page or a profile page means querying the database AND running Jinja.
+# Posts only change through create/update/delete, so most of the time the HTML we would produce
+# is exactly the same as last time. This module remembers rendered HTML fragments for a while.
+#
+# Invalidation uses "generations": every group of pages (e.g. the home feed, or one user's profile)
+# has a counter that is part of the cache key. When a post changes we simply bump the counter,
+# so all the old keys are never looked up again and fall out of the cache on their own.
+#
+# The counters live in the database (the content_versions table, see content_versions.py), NOT in the cache backend,
+# and a write bumps them in its own transaction. So the moment a new post is committed, EVERY gunicorn worker
+# stops serving the old pages - even with the in-process backend, whose cached HTML each worker keeps for itself.
+# The price is one small query per cached page view (the generations, looked up by primary key).
+
+
+class MemoryBackend:
+    # An in-process cache: a size-bounded LRU (Least Recently Used) dictionary with a TTL (Time To Live)
+    def __init__(self, max_entries=512, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # OrderedDict remembers insertion order, so the oldest entry is always at the front
+        self._entries = OrderedDict()
+        # Flask can serve several requests at once (threads), so we protect the dicts with a lock
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                # Too old - throw it away
+                del self._entries[key]
+                return None
+            # Mark as "recently used" by moving it to the back
+            self._entries.move_to_end(key)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            # Evict the least recently used entries when we are over the limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    # Optional shared cache so several gunicorn workers / servers can reuse each other's pages.
+    # Redis does the LRU eviction itself (configure maxmemory-policy allkeys-lru on the server).
+    def __init__(self, url, ttl=60, prefix='page_cache:'):
+        import redis # Only imported if someone actually configures a Redis URL
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        self._redis.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + '*'):
+            self._redis.delete(key)
+
+
+# Bumped by clear(): part of every key, so clearing also reaches the HTML other workers keep in memory
+ALL_PAGES = '*'
+
+
+class PageCache:
+    def __init__(self, app=None, versions=None):
+        self.backend = None
+        self.versions = None
+        if app is not None:
+            self.init_app(app, versions)
+
+    def init_app(self, app, versions):
+        # versions: where the generations are kept, a ContentVersions (see content_versions.py)
+        self.versions = versions
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 512)
+        app.config.setdefault('PAGE_CACHE_TTL', 60)
+        app.config.setdefault('PAGE_CACHE_REDIS_URL', None)
+
+        if not app.config['PAGE_CACHE_ENABLED']:
+            self.backend = None
+        elif app.config['PAGE_CACHE_REDIS_URL']:
+            self.backend = RedisBackend(app.config['PAGE_CACHE_REDIS_URL'], ttl=app.config['PAGE_CACHE_TTL'])
+        else:
+            self.backend = MemoryBackend(max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'],
+                                         ttl=app.config['PAGE_CACHE_TTL'])
+        app.extensions['page_cache'] = self
+
+    def fetch(self, namespace, key, render):
+        # Return the cached HTML for (namespace, key), or call render() and remember the result.
+        if self.backend is None:
+            return render()
+
+        # Read the generation BEFORE rendering: if a post changes while we render,
+        # our (old) result is stored under the old generation and is never served.
+        # render() must read data at least as new as these generations (main.py renders from the primary).
+        page_name, all_name = f'page:{namespace}', f'page:{ALL_PAGES}'
+        generations = self.versions.get_many(page_name, all_name)
+        full_key = f'{namespace}:{generations[page_name]}.{generations[all_name]}:{key}'
+        html = self.backend.get(full_key)
+        if html is None:
+            html = render()
+            self.backend.set(full_key, html)
+        return html
+
+    # invalidate() and clear() must be called BEFORE db.session.commit(): the new generations are then
+    # committed together with the change (and are thrown away with it if the transaction is rolled back)
+    def invalidate(self, *namespaces):
+        if self.backend is None:
+            return
+        self.versions.bump(*[f'page:{namespace}' for namespace in namespaces])
+
+    def clear(self):
+        if self.backend is None:
+            return
+        self.versions.bump(f'page:{ALL_PAGES}')
+        # (only frees this process's memory - the bump above is what reaches the other workers)
+        self.backend.clear()
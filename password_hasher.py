@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout # (doesn't import multiprocessing)
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# --- PASSWORD HASHING SERVICE ---
+# scrypt is SLOW on purpose (that's what makes stolen hashes hard to crack), and it uses a lot of CPU and memory.
+# If we ran it on the request thread, a burst of logins would block every worker and normal page views would wait.
+# So all hashing goes through this service:
+#   * the work runs in a separate pool of processes (the CPU cores are shared out between the web workers),
+#   * only a limited number of jobs may wait at once - when it is full we refuse straight away (503) instead of piling up,
+#   * token buckets (see RateLimiter) stop one IP address or one username from hogging it.
+# The pool, the limit on waiting jobs and the token buckets all belong to ONE web worker process. With
+# several workers the server as a whole runs up to WEB_CONCURRENCY times as many hashes (see config.py).
+
+
+class HashingBusy(Exception):
+    # Raised when too many hashing jobs are already waiting, or a job waited longer than PASSWORD_HASH_TIMEOUT
+    pass
+
+
+def _timed(func, *args, **kwargs):
+    # Runs inside the worker process. We measure the hash time THERE, so the parent can
+    # work out how long the job waited in the queue (total time - hash time).
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'timed_out': 0, 'completed': 0, 'rehashed': 0,
+                       'queue_wait_seconds': 0.0, 'hash_seconds': 0.0, 'max_queue_wait_seconds': 0.0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 'scrypt:32768:8:1' = scrypt with N=32768, r=8, p=1 (werkzeug's default). Raise N to make hashes stronger;
+        # old hashes are upgraded automatically the next time their owner logs in.
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('WEB_CONCURRENCY', 1)
+        # 0 workers = hash on the request thread (tests)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 1) // app.config['WEB_CONCURRENCY']))
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', max(1, app.config['PASSWORD_HASH_WORKERS']) * 4)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        # A semaphore with N slots: each job takes a slot, and if none are free we reject the job.
+        # (A threading semaphore only counts this process's jobs - see the note at the top.)
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'])
+        app.extensions['password_hasher'] = self
+
+    def _get_pool(self):
+        # The pool is created on first use, AFTER gunicorn has forked its workers.
+        # (multiprocessing is only imported then too, which keeps importing the app fast.)
+        with self._lock:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _run(self, func, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HashingBusy()
+        with self._lock:
+            self._stats['submitted'] += 1
+        submitted = time.perf_counter()
+        if not self.workers:
+            try:
+                result, hash_time = _timed(func, *args, **kwargs)
+            finally:
+                self._slots.release()
+        else:
+            try:
+                future = self._get_pool().submit(_timed, func, *args, **kwargs)
+            except Exception:
+                self._slots.release()
+                raise
+            # The slot is given back when the job really FINISHES - not when we stop waiting for it.
+            # Otherwise jobs that timed out would keep running in the pool without taking up a slot,
+            # and the pool's backlog could grow past PASSWORD_HASH_MAX_PENDING.
+            future.add_done_callback(lambda future: self._slots.release())
+            try:
+                result, hash_time = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                with self._lock:
+                    self._stats['timed_out'] += 1
+                # The pool is overloaded (or stuck): tell the client to come back later (503), not a 500
+                raise HashingBusy()
+        queue_wait = max(time.perf_counter() - submitted - hash_time, 0.0)
+
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['queue_wait_seconds'] += queue_wait
+            self._stats['hash_seconds'] += hash_time
+            self._stats['max_queue_wait_seconds'] = max(self._stats['max_queue_wait_seconds'], queue_wait)
+        return result
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # A werkzeug hash looks like 'scrypt:32768:8:1$<salt>$<hash>' - the part before the first '$' is the method
+        return password_hash.split('$', 1)[0] != self.method
+
+    def check_and_upgrade(self, user, password):
+        # Check the password, and if it is right but was hashed with old settings, re-hash it with the current ones.
+        # The caller is responsible for committing the session.
+        if not self.check(user.password_hash, password):
+            return False
+        if self.needs_rehash(user.password_hash):
+            user.password_hash = self.hash(password)
+            with self._lock:
+                self._stats['rehashed'] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class RateLimiter:
+    # Token bucket: every key (an IP address or a username) gets a bucket that holds up to `burst` tokens
+    # and refills at `rate` tokens per second. Each attempt costs one token; an empty bucket means "slow down" (429).
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict() # key -> (tokens, last_refill_time)
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            # Forget the least recently seen keys so the dictionary can't grow forever
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
@@ -0,0 +1,132 @@
+import re
+from sqlalchemy import bindparam, func, inspect, select, text, update
+from sqlalchemy.schema import CreateColumn
+
+# --- POST EXCERPTS AND PER-USER COUNTERS ---
+# Listings (home feed, profiles, search) used to load and render every post's FULL content, so a single
+# very long post made the whole page big and slow. Instead we store a short plain-text excerpt next to
+# each post, and listings only read that. The full text is only loaded on the post's own page.
+#
+# Each user also keeps a post_count and last_posted_at, so "12 posts by this author" needs no COUNT query.
+# create/update/delete keep these up to date in the same transaction as the post itself (see main.py).
+# Rows written before these columns existed are filled in by "flask backfill-post-summaries".
+
+EXCERPT_LENGTH = 200 # characters, not counting the "..."
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    # One line of plain text: newlines, tabs and runs of spaces become single spaces
+    plain = re.sub(r'\s+', ' ', content or '').strip()
+    if len(plain) <= length:
+        return plain
+    # Cut at the last whole word that fits, so we never stop in the middle of a word
+    # (one very long "word", like a URL, is simply cut)
+    cut = plain[:length + 1]
+    cut = cut.rsplit(' ', 1)[0] if ' ' in cut else plain[:length]
+    return cut.rstrip(' .,;:!?-') + '...'
+
+
+def newest_post_date(Post, user_id):
+    # A subquery for "the date of this user's newest post" (NULL when they have none left)
+    return select(func.max(Post.date_posted)).where(Post.user_id == user_id).scalar_subquery()
+
+
+def recount_users(db, User, Post, user_ids):
+    # Recalculate post_count / last_posted_at from the posts table, for many users in ONE UPDATE statement
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    db.session.execute(
+        update(User).where(User.id.in_(user_ids)).values(
+            post_count=select(func.count(Post.id)).where(Post.user_id == User.id).scalar_subquery(),
+            last_posted_at=newest_post_date(Post, User.id)),
+        execution_options={'synchronize_session': False})
+
+
+# --- Backfill ---
+def add_missing_columns(db, model, names):
+    # There are no migrations in this project, and db.create_all() never changes a table that already exists.
+    # So new columns are added here with ALTER TABLE. Returns the names of the columns that were added.
+    table = model.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        # CreateColumn gives us this database's spelling of the column, e.g. "post_count INTEGER DEFAULT '0' NOT NULL"
+        definition = CreateColumn(table.columns[name]).compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {definition}'))
+        added.append(name)
+    db.session.commit()
+    # ...and the indexes on the new columns (e.g. index=True on posts.updated_at)
+    for index in table.indexes:
+        if any(column.name in added for column in index.columns):
+            index.create(db.engine, checkfirst=True)
+    return added
+
+
+def add_missing_indexes(db, model):
+    # db.create_all() doesn't add new indexes to an existing table either. Returns the names of the indexes created.
+    # (On a big MySQL table this takes a while, but InnoDB keeps the table readable and writable meanwhile.)
+    table = model.__table__
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+    added = []
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(db.engine)
+            added.append(index.name)
+    return added
+
+
+def backfill_excerpts(db, Post, batch_size=1000, everything=False):
+    # Walks the posts in id order, one batch at a time (keyset pagination on the primary key),
+    # so memory stays flat and each transaction stays short. Yields the number of posts done so far.
+    done = 0
+    last_id = 0
+    while True:
+        rows = Post.query.with_entities(Post.id, Post.content).filter(Post.id > last_id)
+        if not everything:
+            rows = rows.filter(Post.excerpt.is_(None))
+        rows = rows.order_by(Post.id).limit(batch_size).all()
+        if not rows:
+            return
+        # One UPDATE statement for the whole batch ("executemany")
+        db.session.execute(
+            update(Post.__table__).where(Post.__table__.c.id == bindparam('post_id')),
+            [{'post_id': post_id, 'excerpt': make_excerpt(content)} for post_id, content in rows])
+        db.session.commit()
+        last_id = rows[-1][0]
+        done += len(rows)
+        yield done
+
+
+def backfill_updated_at(db, Post, batch_size=1000):
+    # Posts written before updated_at existed start with their date_posted.
+    # Setting updated_at explicitly means the column's onupdate (the current time) is not used.
+    done = 0
+    while True:
+        post_ids = [post_id for (post_id,) in Post.query.with_entities(Post.id).filter(Post.updated_at.is_(None))
+                    .order_by(Post.id).limit(batch_size)]
+        if not post_ids:
+            return
+        db.session.execute(update(Post).where(Post.id.in_(post_ids)).values(updated_at=Post.date_posted),
+                           execution_options={'synchronize_session': False})
+        db.session.commit()
+        done += len(post_ids)
+        yield done
+
+
+def backfill_user_counters(db, User, Post, batch_size=1000):
+    # Same idea for users: one recount_users() UPDATE per batch of user ids
+    done = 0
+    last_id = 0
+    while True:
+        user_ids = [user_id for (user_id,) in
+                    User.query.with_entities(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size)]
+        if not user_ids:
+            return
+        recount_users(db, User, Post, user_ids)
+        db.session.commit()
+        last_id = user_ids[-1]
+        done += len(user_ids)
+        yield done
@@ -0,0 +1,186 @@
+import random
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- REQUEST METRICS ---
+# For every request we record:
+#   * how many SQL queries it ran and how long they took,
+#   * how long Jinja spent rendering templates,
+#   * the total time, per route, as a histogram.
+# If the SAME query shape runs many times in one request (e.g. "SELECT ... FROM users WHERE id = ?" once per post)
+# that is usually an "N+1" problem, so we log a warning.
+# Everything is exported at /metrics in the Prometheus text format.
+# Counting is cheap enough to always do; the detailed trace (slowest statements) is only kept for a sample of requests.
+
+# Histogram bucket boundaries, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+
+# The query listeners only write to flask.g (the current request), so they are plain functions shared by every app
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_query_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'metrics_query_started' not in g:
+        return
+    elapsed = time.perf_counter() - g.metrics_query_started
+    g.metrics_queries += 1
+    g.metrics_db_seconds += elapsed
+    # SQLAlchemy gives us the statement with placeholders (?), so identical shapes compare equal
+    g.metrics_shapes[statement] += 1
+    if g.metrics_sampled:
+        g.metrics_statements.append((elapsed, statement))
+
+
+class RequestMetrics:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._latency = {}            # (endpoint, method) -> Histogram
+        self._requests = Counter()    # (endpoint, method, status) -> count
+        self._queries = Counter()     # endpoint -> total queries
+        self._db_seconds = Counter()  # endpoint -> total seconds in the database
+        self._render_seconds = Counter()
+        self._n_plus_one = Counter()  # endpoint -> number of requests flagged
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_TRACE_SAMPLE_RATE', 0.01) # 1% of requests get a detailed trace
+        app.config.setdefault('METRICS_N_PLUS_ONE_THRESHOLD', 5)  # same statement this many times = suspicious
+        app.config.setdefault('METRICS_SLOW_STATEMENTS', 5)       # how many slow statements a trace keeps
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        # Listening on the Engine CLASS catches every engine, so we don't need an app context here.
+        # Only listen once, even when create_app() builds several apps (every query would be counted twice).
+        if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_execute)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        app.extensions['request_metrics'] = self
+
+    def add_collector(self, collect):
+        # collect() returns a list of (name, type, help text, value) for extra numbers to export
+        if collect not in self._collectors:
+            self._collectors.append(collect)
+
+    # --- Per-request bookkeeping (stored on flask.g, which belongs to a single request) ---
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+        g.metrics_render_seconds = 0.0
+        g.metrics_render_stack = []
+        g.metrics_shapes = Counter()
+        g.metrics_sampled = random.random() < current_app.config['METRICS_TRACE_SAMPLE_RATE']
+        g.metrics_statements = []
+
+    def _start_render(self, sender, template, context, **extra):
+        if 'metrics_started' in g:
+            g.metrics_render_stack.append(time.perf_counter())
+
+    def _finish_render(self, sender, template, context, **extra):
+        if 'metrics_started' in g and g.metrics_render_stack:
+            started = g.metrics_render_stack.pop()
+            # Only count the outermost render, otherwise nested render_template() calls are counted twice
+            if not g.metrics_render_stack:
+                g.metrics_render_seconds += time.perf_counter() - started
+
+    def _finish_request(self, response):
+        if 'metrics_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started
+        endpoint = request.endpoint or 'unknown'
+
+        repeated = [(count, shape) for shape, count in g.metrics_shapes.items()
+                    if count >= current_app.config['METRICS_N_PLUS_ONE_THRESHOLD']]
+        for count, shape in repeated:
+            current_app.logger.warning('Possible N+1 in %s: statement ran %d times: %s', endpoint, count, shape)
+
+        if g.metrics_sampled:
+            slowest = sorted(g.metrics_statements, reverse=True)[:current_app.config['METRICS_SLOW_STATEMENTS']]
+            current_app.logger.info('Trace %s %s: %.1fms total, %d queries (%.1fms), render %.1fms, slowest: %s',
+                                    request.method, request.path, elapsed * 1000, g.metrics_queries,
+                                    g.metrics_db_seconds * 1000, g.metrics_render_seconds * 1000,
+                                    [(round(seconds * 1000, 2), statement) for seconds, statement in slowest])
+
+        with self._lock:
+            key = (endpoint, request.method)
+            if key not in self._latency:
+                self._latency[key] = Histogram()
+            self._latency[key].observe(elapsed)
+            self._requests[(endpoint, request.method, response.status_code)] += 1
+            self._queries[endpoint] += g.metrics_queries
+            self._db_seconds[endpoint] += g.metrics_db_seconds
+            self._render_seconds[endpoint] += g.metrics_render_seconds
+            if repeated:
+                self._n_plus_one[endpoint] += 1
+        return response
+
+    # --- Prometheus export ---
+    def export(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Requests handled, by route, method and status.')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}')
+
+            lines.append('# HELP http_request_duration_seconds Request latency, by route and method.')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (endpoint, method), histogram in sorted(self._latency.items()):
+                labels = _labels(endpoint=endpoint, method=method)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.total}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.total}')
+
+            for name, help_text, values in (
+                    ('db_queries_total', 'SQL statements executed, by route.', self._queries),
+                    ('db_query_seconds_total', 'Time spent in SQL statements, by route.', self._db_seconds),
+                    ('template_render_seconds_total', 'Time spent rendering templates, by route.', self._render_seconds),
+                    ('n_plus_one_requests_total', 'Requests with a repeated statement shape, by route.', self._n_plus_one)):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{name}{{{_labels(endpoint=endpoint)}}} {value}')
+
+        for collect in self._collectors:
+            for name, metric_type, help_text, value in collect():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from flask import current_app, request, url_for
+
+try:
+    import brotli # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# --- RESPONSE OPTIMISATION ---
+# Makes pages smaller and lets browsers skip downloading pages they already have:
+#   * Compression: text responses above a size threshold are gzip (or brotli) compressed.
+#   * ETags: every HTML page gets a fingerprint (ETag). When the browser asks again with If-None-Match
+#     and the page hasn't changed, we answer "304 Not Modified" with an empty body.
+#   * Static files: asset_url() adds a content hash (?v=...) to CSS links, so they can be cached for a year -
+#     when the file changes, the hash (and therefore the URL) changes too.
+# Individual routes can switch these off with the @optimize(...) decorator.
+# CPU time spent compressing and bytes saved are counted, and exported at /metrics.
+
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript'}
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def optimize(compress=True, etag=True):
+    # Per-route switch, e.g. @optimize(compress=False) on a view
+    def decorator(view):
+        view.response_options = {'compress': compress, 'etag': etag}
+        return view
+    return decorator
+
+
+class ResponseOptimizer:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self._stats = {'compressed_responses': 0, 'bytes_before': 0, 'bytes_after': 0,
+                       'compress_cpu_seconds': 0.0, 'not_modified_responses': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_COMPRESSION_ENABLED', True)
+        app.config.setdefault('RESPONSE_COMPRESSION_MIN_SIZE', 500) # bytes - smaller responses aren't worth it
+        app.config.setdefault('RESPONSE_COMPRESSION_LEVEL', 6)
+        app.config.setdefault('RESPONSE_ETAGS_ENABLED', True)
+        app.after_request(self._optimize)
+        app.jinja_env.globals['asset_url'] = self.asset_url
+        app.extensions['response_optimizer'] = self
+
+    # --- Static assets ---
+    def asset_url(self, filename):
+        # /static/css/style.css?v=<first 12 characters of the file's md5>
+        if filename not in self._fingerprints or current_app.debug:
+            with open(os.path.join(current_app.static_folder, filename), 'rb') as f:
+                self._fingerprints[filename] = hashlib.md5(f.read()).hexdigest()[:12]
+        return url_for('static', filename=filename, v=self._fingerprints[filename])
+
+    # --- after_request hook ---
+    def _optimize(self, response):
+        if request.endpoint == 'static':
+            if 'v' in request.args:
+                # The URL changes whenever the file does, so the browser may keep it forever
+                response.cache_control.no_cache = None # Flask sends no-cache for static files by default
+                response.cache_control.public = True
+                response.cache_control.max_age = ONE_YEAR
+                response.cache_control.immutable = True
+            return response
+
+        view = current_app.view_functions.get(request.endpoint)
+        options = getattr(view, 'response_options', {'compress': True, 'etag': True})
+
+        # Streamed responses (like the JSON API) are never buffered here
+        if response.is_streamed or response.direct_passthrough or response.status_code != 200:
+            return response
+
+        if options['etag'] and current_app.config['RESPONSE_ETAGS_ENABLED'] \
+                and request.method in ('GET', 'HEAD') and response.mimetype == 'text/html':
+            response.add_etag(weak=True)
+            # no-cache = "you may keep it, but check with me first" - which is exactly what the ETag is for
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+            if response.status_code == 304:
+                with self._lock:
+                    self._stats['not_modified_responses'] += 1
+                return response
+
+        if options['compress'] and current_app.config['RESPONSE_COMPRESSION_ENABLED']:
+            self._compress(response)
+        return response
+
+    def _compress(self, response):
+        if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+            return
+        # Whatever we decide, caches must know the answer depends on Accept-Encoding
+        response.vary.add('Accept-Encoding')
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            encoding = 'br'
+        elif accepted['gzip']:
+            encoding = 'gzip'
+        else:
+            return
+        body = response.get_data()
+        if len(body) < current_app.config['RESPONSE_COMPRESSION_MIN_SIZE']:
+            return
+
+        # thread_time() only counts THIS thread's CPU time, so other requests don't skew the measurement
+        started = time.thread_time()
+        level = current_app.config['RESPONSE_COMPRESSION_LEVEL']
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=min(level, 11))
+        else:
+            compressed = gzip.compress(body, compresslevel=level)
+        cpu_seconds = time.thread_time() - started
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self._stats['compressed_responses'] += 1
+            self._stats['bytes_before'] += len(body)
+            self._stats['bytes_after'] += len(compressed)
+            self._stats['compress_cpu_seconds'] += cpu_seconds
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,265 @@
+import atexit
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import weakref
+from collections import Counter
+
+# --- FULL-TEXT SEARCH INDEX ---
+# Searching posts with LIKE '%word%' makes the database read EVERY post on every search.
+# Instead we keep an "inverted index" in memory: for every word, which posts contain it and how many times.
+#   'flask' -> {3: 2, 17: 1}   (post 3 mentions "flask" twice, post 17 once)
+# Results are ranked with BM25, the classic search-engine formula: rare words count more than common ones,
+# and a match in a short post counts more than the same match in a very long one.
+#
+# The index is updated one post at a time when posts are created/edited/deleted, and saved to a JSON file
+# so a restart doesn't need to re-read and re-tokenise every post.
+# The file remembers each post's updated_at. When it is loaded, only posts that were created, edited or deleted
+# since then (by any process) are re-read from the database.
+# NOTE: each server process has its own copy. Edits made by OTHER processes show up after a restart
+# or `flask rebuild-search-index`.
+
+SNAPSHOT_VERSION = 2
+TOKEN_PATTERN = re.compile(r'\w+')
+TITLE_WEIGHT = 2 # a word in the title counts as much as appearing twice in the content
+
+# BM25 tuning constants (these are the usual default values)
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def post_terms(title, content):
+    terms = Counter(tokenize(content))
+    for term in tokenize(title):
+        terms[term] += TITLE_WEIGHT
+    return terms
+
+
+def post_version(updated_at):
+    # What the snapshot stores to tell whether a post changed: its updated_at, as text (None for old posts)
+    return updated_at.isoformat() if updated_at else None
+
+
+# Every index saves itself when the server shuts down, so the next start doesn't have to rebuild it.
+# ONE exit hook covers all of them (each create_app() makes its own index).
+_indexes = weakref.WeakSet()
+
+
+@atexit.register
+def _save_all_if_changed():
+    for index in list(_indexes):
+        index.save_if_changed()
+
+
+class SearchIndex:
+    def __init__(self, app=None):
+        self.path = None
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_INDEX_PATH', os.path.join(app.root_path, 'search_index.json'))
+        self.path = app.config['SEARCH_INDEX_PATH']
+        app.extensions['search_index'] = self
+        _indexes.add(self)
+
+    def _reset(self):
+        self._postings = {}   # term -> {post_id: term frequency}
+        self._doc_terms = {}  # post_id -> {term: term frequency}, needed to remove/replace a post
+        self._doc_versions = {} # post_id -> post_version() of the post these terms came from
+        self._removed = set()   # posts deleted by this process since the last load/save (see save())
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._sorted_terms = [] # kept in alphabetical order so prefix searches can use binary search
+
+    # --- Updating the index ---
+    def _add_terms(self, post_id, terms, version):
+        self._remove(post_id)
+        self._doc_terms[post_id] = dict(terms)
+        self._doc_versions[post_id] = version
+        length = sum(terms.values())
+        self._doc_lengths[post_id] = length
+        self._total_length += length
+        for term, frequency in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                bisect.insort(self._sorted_terms, term)
+            self._postings[term][post_id] = frequency
+
+    def _remove(self, post_id):
+        terms = self._doc_terms.pop(post_id, None)
+        if terms is None:
+            return
+        del self._doc_versions[post_id]
+        self._total_length -= self._doc_lengths.pop(post_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[post_id]
+            if not postings:
+                # Nobody uses this word any more
+                del self._postings[term]
+                del self._sorted_terms[bisect.bisect_left(self._sorted_terms, term)]
+
+    def add(self, post_model, post):
+        # Add a new post, or replace an edited one
+        with self._lock:
+            self.ensure_loaded(post_model)
+            self._add_terms(post.id, post_terms(post.title, post.content), post_version(post.updated_at))
+            self._dirty = True
+
+    def remove(self, post_model, post_id):
+        with self._lock:
+            self.ensure_loaded(post_model)
+            self._remove(post_id)
+            self._removed.add(post_id)
+            self._dirty = True
+
+    # --- Loading, rebuilding and saving ---
+    def ensure_loaded(self, post_model):
+        # Load the index the first time it is needed: from the snapshot file if there is one, otherwise from the database
+        with self._lock:
+            if self._loaded:
+                return
+            if not self.load(post_model):
+                self.rebuild(post_model)
+            self._loaded = True
+
+    def rebuild(self, post_model, batch_size=1000):
+        # Re-tokenise every post. Only loads id/title/content, in batches, so memory stays flat.
+        with self._lock:
+            self._reset()
+            rows = post_model.query.with_entities(post_model.id, post_model.title, post_model.content,
+                                                  post_model.updated_at)
+            count = 0
+            for post_id, title, content, updated_at in rows.yield_per(batch_size):
+                self._add_terms(post_id, post_terms(title, content), post_version(updated_at))
+                count += 1
+            self._loaded = True
+            self._dirty = True
+            return count
+
+    def _read_snapshot(self):
+        # Returns (docs, versions) with integer post ids, or None if there is no usable snapshot
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Older snapshots have no versions, so there is no way to tell which posts were edited
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        docs = {int(post_id): terms for post_id, terms in snapshot['docs'].items()}
+        versions = {int(post_id): version for post_id, version in snapshot['versions'].items()}
+        return docs, versions
+
+    def load(self, post_model, batch_size=1000):
+        # Returns False if there is no usable snapshot
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            return False
+        docs, versions = snapshot
+
+        with self._lock:
+            self._reset()
+            for post_id, terms in docs.items():
+                self._add_terms(post_id, terms, versions.get(post_id))
+
+            # Catch up with posts created, edited or deleted since the snapshot was written
+            # (cheap: only ids and updated_at are read for every post)
+            current = {post_id: post_version(updated_at) for post_id, updated_at
+                       in post_model.query.with_entities(post_model.id, post_model.updated_at)}
+            deleted_ids = set(self._doc_terms) - set(current)
+            for post_id in deleted_ids:
+                self._remove(post_id)
+            changed_ids = sorted(post_id for post_id, version in current.items()
+                                 if post_id not in self._doc_terms or self._doc_versions[post_id] != version)
+            for start in range(0, len(changed_ids), batch_size):
+                rows = post_model.query.with_entities(post_model.id, post_model.title, post_model.content,
+                                                      post_model.updated_at) \
+                                       .filter(post_model.id.in_(changed_ids[start:start + batch_size]))
+                for post_id, title, content, updated_at in rows:
+                    self._add_terms(post_id, post_terms(title, content), post_version(updated_at))
+            self._dirty = bool(deleted_ids or changed_ids)
+        return True
+
+    def save(self, merge=True):
+        if not self.path:
+            return
+        with self._lock:
+            docs, versions = dict(self._doc_terms), dict(self._doc_versions)
+            # Every worker saves its own copy at exit. So that the last one to exit doesn't throw away
+            # what the others learned, keep any post from the file that is newer there (or that we never saw),
+            # unless this process deleted it. (Posts deleted by other processes are dropped again by load().)
+            # After rebuild() the index is complete, so merge=False simply replaces the file.
+            on_disk = self._read_snapshot() if merge else None
+            if on_disk is not None:
+                for post_id, terms in on_disk[0].items():
+                    version = on_disk[1].get(post_id)
+                    if post_id in self._removed:
+                        continue
+                    if post_id not in docs or (version or '') > (versions[post_id] or ''):
+                        docs[post_id] = terms
+                        versions[post_id] = version
+            snapshot = {'version': SNAPSHOT_VERSION, 'docs': docs, 'versions': versions}
+            # Write to a temporary file and then rename it, so a crash never leaves half a snapshot behind
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+            self._removed = set()
+            self._dirty = False
+
+    def save_if_changed(self):
+        if self._loaded and self._dirty:
+            self.save()
+
+    # --- Searching ---
+    def _matching_terms(self, word):
+        # 'pyth*' matches every indexed word starting with 'pyth'; anything else must match exactly
+        if not word.endswith('*'):
+            return [word] if word in self._postings else []
+        prefix = word[:-1]
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        matches = []
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, post_model, query, page=1, per_page=10):
+        # Returns (post ids for this page, best match first, total number of matching posts)
+        words = [word.lower() for word in re.findall(r'\w+\*?', query)]
+        with self._lock:
+            self.ensure_loaded(post_model)
+            doc_count = len(self._doc_lengths)
+            if not words or not doc_count:
+                return [], 0
+            average_length = self._total_length / doc_count
+
+            scores = Counter()
+            for word in words:
+                for term in self._matching_terms(word):
+                    postings = self._postings[term]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for post_id, frequency in postings.items():
+                        length_norm = 1 - B + B * self._doc_lengths[post_id] / average_length
+                        scores[post_id] += idf * frequency * (K1 + 1) / (frequency + K1 * length_norm)
+
+        # Sort by score (highest first), newest post first when scores tie
+        ranked = sorted(scores, key=lambda post_id: (-scores[post_id], -post_id))
+        start = (page - 1) * per_page
+        return ranked[start:start + per_page], len(ranked)
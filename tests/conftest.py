@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live in the repository root (there is no package), so make them importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from config import TestingConfig  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    # A fresh app on an in-memory SQLite database for every test
+    app = main.create_app(TestingConfig)
+    with app.app_context():
+        # Only the primary database: db remembers the replica binds of earlier test apps (see test_database.py)
+        main.db.create_all(bind_key=None)
+    yield app
+    with app.app_context():
+        main.db.session.remove()
+        main.db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
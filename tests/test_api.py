@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import main
+from config import TestingConfig
+
+
+def make_author(app, username='author'):
+    with app.app_context():
+        user = main.User(username=username, email=f'{username}@example.com', password_hash='x')
+        main.db.session.add(user)
+        main.db.session.commit()
+        return user.id
+
+
+def log_in(client, user_id):
+    with client.session_transaction() as cookie_session:
+        cookie_session['user_id'] = user_id
+
+
+def create_post(client, title='Hello'):
+    assert client.post('/create', data={'title': title, 'content': 'hello'}).status_code == 302
+
+
+def etag(client, path='/api/posts'):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_unchanged_posts_answer_304_without_reading_posts(app, client):
+    log_in(client, make_author(app))
+    create_post(client)
+    tag = etag(client)
+
+    statements = []
+    with app.app_context():
+        engine = main.db.engine
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get('/api/posts', headers={'If-None-Match': tag})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 304
+    assert response.data == b''
+    assert not [statement for statement in statements if 'FROM post' in statement]
+
+
+def test_every_write_route_changes_the_etag(app, client):
+    log_in(client, make_author(app))
+    create_post(client, 'First')
+    create_post(client, 'Second')
+    tags = [etag(client)]
+
+    create_post(client, 'Third') # often in the same second as the others
+    tags.append(etag(client))
+    assert client.post('/post/1/update', data={'title': 'Edited', 'content': 'edited'}).status_code == 302
+    tags.append(etag(client))
+    assert client.post('/post/1/delete').status_code == 302
+    tags.append(etag(client))
+
+    assert len(set(tags)) == 4
+    assert client.get('/api/posts', headers={'If-None-Match': tags[0]}).status_code == 200
+
+
+def test_renaming_the_author_changes_the_etag(app, client):
+    log_in(client, make_author(app))
+    create_post(client)
+    tag = etag(client, '/api/posts?fields=id,author')
+
+    response = client.post('/account', data={'username': 'renamed', 'email': 'author@example.com'})
+    assert response.status_code == 302
+    response = client.get('/api/posts?fields=id,author', headers={'If-None-Match': tag})
+    assert response.status_code == 200
+    assert response.json['posts'][0]['author'] == 'renamed'
+
+
+def test_last_modified_is_only_sent_for_changes_older_than_a_second(app, client):
+    log_in(client, make_author(app))
+    create_post(client)
+    # Just changed: another change could still happen in the same second
+    assert 'Last-Modified' not in client.get('/api/posts').headers
+
+    with app.app_context():
+        version = main.db.session.get(main.ContentVersion, 'posts')
+        version.changed_at = datetime.utcnow() - timedelta(seconds=5)
+        main.db.session.commit()
+    last_modified = client.get('/api/posts').headers['Last-Modified']
+    assert client.get('/api/posts', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    create_post(client, 'Newer')
+    assert client.get('/api/posts', headers={'If-Modified-Since': last_modified}).status_code == 200
+
+
+def test_every_worker_gives_the_same_etag(tmp_path):
+    # Two apps on one database file, like two gunicorn workers (one with the page cache switched off)
+    class FileConfig(TestingConfig):
+        DB_URI = f'sqlite:///{tmp_path / "posts.sqlite"}'
+
+    class NoPageCacheConfig(FileConfig):
+        PAGE_CACHE_ENABLED = False
+
+    first, second = main.create_app(FileConfig), main.create_app(NoPageCacheConfig)
+    with first.app_context():
+        main.db.create_all(bind_key=None)
+    client = first.test_client()
+    log_in(client, make_author(first))
+    create_post(client)
+
+    assert etag(first.test_client()) == etag(second.test_client())
+    assert etag(first.test_client(), '/api/users/author/posts') == \
+        etag(second.test_client(), '/api/users/author/posts')
+    for app in (first, second):
+        with app.app_context():
+            main.db.engine.dispose()
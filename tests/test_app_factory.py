@@ -0,0 +1,32 @@
+import main
+from config import TestingConfig
+
+
+class OtherConfig(TestingConfig):
+    PASSWORD_HASH_WORKERS = 3
+    PAGE_CACHE_ENABLED = False
+
+
+def test_each_app_keeps_its_own_extensions():
+    first = main.create_app('testing')
+    second = main.create_app(OtherConfig)
+
+    for name in ('mail_queue', 'password_hasher', 'page_cache', 'search_index', 'request_metrics',
+                 'response_optimizer', 'user_cache'):
+        assert first.extensions[name] is not second.extensions[name]
+
+    # Creating the second app must not change the first one
+    assert first.extensions['password_hasher'].workers == 0
+    assert second.extensions['password_hasher'].workers == 3
+    assert first.extensions['page_cache'].backend is not None
+    assert second.extensions['page_cache'].backend is None
+    assert first.extensions['mail_queue'].app is first
+
+
+def test_module_names_follow_the_current_app():
+    first = main.create_app('testing')
+    second = main.create_app(OtherConfig)
+    with first.app_context():
+        assert main.password_hasher.workers == 0
+    with second.app_context():
+        assert main.password_hasher.workers == 3
@@ -0,0 +1,64 @@
+import json
+from datetime import datetime
+
+import main
+
+
+def run_import(app, tmp_path, rows, *args):
+    path = tmp_path / 'import.ndjson'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows), encoding='utf-8')
+    return app.test_cli_runner().invoke(args=['import', str(path), *args])
+
+
+AUTHOR = {'type': 'user', 'username': 'author', 'email': 'author@example.com', 'password_hash': 'x'}
+
+
+def test_duplicate_post_ids_in_one_batch_keep_the_last_row(app, tmp_path):
+    result = run_import(app, tmp_path, [
+        AUTHOR,
+        {'type': 'post', 'id': 7, 'title': 'First', 'content': 'one', 'author': 'author'},
+        {'type': 'post', 'title': 'No id', 'content': 'two', 'author': 'author'},
+        {'type': 'post', 'id': '7', 'title': 'Second', 'content': 'three', 'author': 'author'},
+    ])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        assert main.db.session.get(main.Post, 7).title == 'Second'
+        assert main.Post.query.count() == 2
+        assert main.User.query.one().post_count == 2
+        # The API's version changed in the same transaction
+        assert main.content_versions.get('posts')[0] >= 1
+
+
+def test_rows_the_database_refuses_are_reported_not_raised(app, tmp_path):
+    # Different usernames but the same email, in one batch: the unique email index refuses the second user
+    result = run_import(app, tmp_path, [AUTHOR, {**AUTHOR, 'username': 'someone_else'}])
+    assert result.exit_code == 1
+    assert 'Error: the database refused a row' in result.output
+    assert result.exception is None or isinstance(result.exception, SystemExit)
+
+    with app.app_context():
+        assert main.User.query.count() == 0
+
+
+def test_upserted_posts_keep_their_date_unless_the_row_has_one(app, tmp_path):
+    first = {'type': 'post', 'title': 'First', 'content': 'one', 'author': 'author', 'date_posted': '2020-01-01T09:00:00'}
+    result = run_import(app, tmp_path, [AUTHOR, {**first, 'id': 1},
+                                        {**first, 'id': 2, 'date_posted': '2020-02-02T09:00:00'}])
+    assert result.exit_code == 0, result.output
+
+    # One batch with both kinds of update: without a date and with a new one
+    result = run_import(app, tmp_path, [
+        {'type': 'post', 'id': 1, 'title': 'Edited', 'content': 'one', 'author': 'author'},
+        {'type': 'post', 'id': 2, 'title': 'Edited', 'content': 'two', 'author': 'author',
+         'date_posted': '2021-03-03T09:00:00'},
+        {'type': 'post', 'id': 3, 'title': 'New', 'content': 'three', 'author': 'author'},
+    ], '--upsert')
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        assert main.db.session.get(main.Post, 1).title == 'Edited'
+        assert main.db.session.get(main.Post, 1).date_posted == datetime(2020, 1, 1, 9)
+        assert main.db.session.get(main.Post, 2).date_posted == datetime(2021, 3, 3, 9)
+        assert main.db.session.get(main.Post, 3).date_posted > datetime(2024, 1, 1)
+        assert main.User.query.one().last_posted_at > datetime(2024, 1, 1)
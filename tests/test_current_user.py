@@ -0,0 +1,66 @@
+import pytest
+from flask import session
+from sqlalchemy import event
+
+import main
+
+
+def log_in_author(app, client):
+    with app.app_context():
+        author = main.User(username='author', email='author@example.com', password_hash='x')
+        main.db.session.add(author)
+        main.db.session.commit()
+        author_id = author.id
+    with client.session_transaction() as cookie_session:
+        cookie_session['user_id'] = author_id
+    return author_id
+
+
+@pytest.fixture
+def user_loads(app):
+    # A list that grows by one for every SELECT on the users table
+    loads = []
+    with app.app_context():
+        engine = main.db.engine
+    def record(conn, cursor, statement, *args):
+        if statement.startswith('SELECT') and 'FROM users' in statement:
+            loads.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    yield loads
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_the_user_is_loaded_once_per_request_then_from_the_cache(app, client, user_loads):
+    author_id = log_in_author(app, client)
+    user_loads.clear()
+
+    with app.test_request_context('/'):
+        session['user_id'] = author_id
+        first = main.get_current_user()
+        assert main.get_current_user() is first
+        assert first == main.CurrentUser(author_id, 'author', 'author@example.com')
+    assert len(user_loads) == 1
+
+    # Later requests find it in the user cache
+    assert client.get('/account').status_code == 200
+    assert client.get('/account').status_code == 200
+    assert len(user_loads) == 1
+
+
+def test_changing_the_account_drops_the_cached_user(app, client):
+    log_in_author(app, client)
+    client.get('/account')
+    client.post('/account', data={'username': 'renamed', 'email': 'new@example.com'})
+
+    html = client.get('/account').get_data(as_text=True)
+    assert 'renamed' in html and 'new@example.com' in html
+
+
+def test_a_deleted_account_is_not_a_current_user(app, client):
+    author_id = log_in_author(app, client)
+    with app.app_context():
+        main.db.session.delete(main.db.session.get(main.User, author_id))
+        main.db.session.commit()
+    with app.test_request_context('/'):
+        session['user_id'] = author_id
+        assert main.get_current_user() is None
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime
+
+import pytest
+from flask import g, session
+
+import main
+from config import TestingConfig
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    # Two SQLite files: the "primary" and one "replica". Nothing copies rows between them,
+    # so a user that only exists in the replica shows which database answered a query.
+    class ReplicaConfig(TestingConfig):
+        DB_URI = f'sqlite:///{tmp_path / "primary.sqlite"}'
+        DB_REPLICA_URIS = [f'sqlite:///{tmp_path / "replica.sqlite"}']
+        DB_REPLICA_STICKY_SECONDS = 5
+        PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+    app = main.create_app(ReplicaConfig)
+    with app.app_context():
+        main.db.create_all(bind_key=None)
+        main.db.metadata.create_all(main.db.engines['replica_0'])
+        with main.db.engines['replica_0'].begin() as connection:
+            connection.execute(main.User.__table__.insert().values(
+                username='replica_only', email='replica@example.com', password_hash='x'))
+    yield app
+    with app.app_context():
+        main.db.session.remove()
+        for engine in main.db.engines.values():
+            engine.dispose()
+
+
+def profile_status(client):
+    # 200 when the read went to the replica, 404 when it went to the primary
+    return client.get('/api/users/replica_only/posts').status_code
+
+
+def register(client, username):
+    return client.post('/register', data={'username': username, 'email': f'{username}@example.com',
+                                          'password': 'Password1!'})
+
+
+def test_read_only_views_read_from_the_replica(replica_app):
+    client = replica_app.test_client()
+    assert profile_status(client) == 200
+
+
+def test_reads_stick_to_the_primary_after_a_write(replica_app):
+    client = replica_app.test_client()
+    assert register(client, 'writer').status_code == 302
+    with client.session_transaction() as cookie_session:
+        assert cookie_session['_primary_until'] > time.time()
+
+    # The same browser now reads from the primary...
+    assert profile_status(client) == 404
+    # ...while somebody else still reads from the replica
+    assert profile_status(replica_app.test_client()) == 200
+
+    # Once the sticky window is over, the replica is used again
+    with client.session_transaction() as cookie_session:
+        cookie_session['_primary_until'] = time.time() - 1
+    assert profile_status(client) == 200
+
+
+def test_reads_after_a_flush_in_the_same_request_use_the_primary(replica_app):
+    with replica_app.test_request_context('/'):
+        g.use_replica = True
+        assert main.User.query.filter_by(username='replica_only').first() is not None
+
+        main.db.session.add(main.User(username='fresh', email='fresh@example.com', password_hash='x'))
+        main.db.session.flush()
+        assert main.db.session.info['wrote']
+        assert session['_primary_until'] > time.time()
+        # The new row is only visible on the primary, and that's where the read goes
+        assert main.User.query.filter_by(username='fresh').first() is not None
+        assert main.User.query.filter_by(username='replica_only').first() is None
+        main.db.session.rollback()
+
+
+def test_without_replicas_everything_uses_the_primary(app):
+    with app.test_request_context('/'):
+        g.use_replica = True
+        assert main.db.session.get_bind(clause=main.db.select(main.User)) is main.db.engine
+
+
+def test_page_cache_misses_are_rendered_from_the_primary(replica_app):
+    # The replica has already received the new cache generation but not yet the post written with it
+    with replica_app.app_context():
+        author = main.User(username='author', email='author@example.com', password_hash='x')
+        main.db.session.add(main.Post(title='Fresh post', content='new', author=author))
+        main.page_cache.invalidate('home')
+        main.db.session.commit()
+        with main.db.engines['replica_0'].begin() as connection:
+            connection.execute(main.ContentVersion.__table__.insert().values(
+                name='page:home', version=1, changed_at=datetime.utcnow()))
+
+    client = replica_app.test_client()
+    assert profile_status(client) == 200
+    # Rendered from the replica, the feed would be cached without the post until the next write
+    assert 'Fresh post' in client.get('/').get_data(as_text=True)
+    assert 'Fresh post' in replica_app.test_client().get('/').get_data(as_text=True)
@@ -0,0 +1,10 @@
+import check_import_time
+
+
+def test_starting_the_app_stays_fast_and_lazy():
+    # One fresh interpreter (see check_import_time.measure), so earlier tests' imports don't count
+    modules, create_app_ms = check_import_time.measure()
+
+    assert modules['main'][1] / 1000 <= check_import_time.IMPORT_BUDGET_MS
+    assert create_app_ms <= check_import_time.CREATE_APP_BUDGET_MS
+    assert [name for name in check_import_time.LAZY_MODULES if name in modules] == []
@@ -0,0 +1,207 @@
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask
+from flask_mail import Message
+
+from mail_queue import MailQueue
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    # Just enough SMTP for smtplib: every message is recorded, and the first `fail_next`
+    # MAIL FROM commands are answered with a temporary error (451) so the sender has to retry.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), SMTPHandler)
+        self.lock = threading.Lock()
+        self.received = []  # (recipients, time)
+        self.attempts = []  # time of every MAIL FROM
+        self.connections = 0
+        self.fail_next = 0
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        recipients = []
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                recipients = []
+                with server.lock:
+                    server.attempts.append(time.monotonic())
+                    refuse = server.fail_next > 0
+                    if refuse:
+                        server.fail_next -= 1
+                self.reply('451 try again later' if refuse else '250 OK')
+            elif command == 'RCPT':
+                recipients.append(line.split(':', 1)[1].strip(' <>'))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                with server.lock:
+                    server.received.append((recipients, time.monotonic()))
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else: # RSET, NOOP
+                self.reply('250 OK')
+
+
+def start_server(port=0):
+    server = SMTPStandIn(port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp_server():
+    server = start_server()
+    yield server
+    stop_server(server)
+
+
+def make_queue(smtp_server, **config):
+    app = Flask(__name__)
+    config.setdefault('MAIL_QUEUE_RETRY_DELAY', 0.01)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_server.server_address[1], MAIL_USE_TLS=False,
+                      **config)
+    return MailQueue(app)
+
+
+def message(number):
+    return Message(f'Message {number}', sender='test@example.com', recipients=[f'user{number}@example.com'],
+                   body='hello')
+
+
+def test_messages_are_sent_in_batches_and_flush_waits(smtp_server):
+    queue = make_queue(smtp_server, MAIL_QUEUE_BATCH_SIZE=20)
+    for number in range(5):
+        assert queue.enqueue(message(number))
+    assert queue.flush(timeout=10)
+
+    assert sorted(recipients[0] for recipients, _ in smtp_server.received) == \
+        [f'user{number}@example.com' for number in range(5)]
+    stats = queue.stats()
+    assert stats['sent'] == 5 and stats['pending'] == 0 and stats['failed'] == 0
+    # Several messages went over one connection
+    assert smtp_server.connections == stats['batches'] <= 5
+
+
+def test_failed_messages_are_retried_with_growing_delays(smtp_server):
+    smtp_server.fail_next = 2
+    queue = make_queue(smtp_server, MAIL_QUEUE_RETRY_DELAY=0.2, MAIL_QUEUE_MAX_ATTEMPTS=5)
+    queue.enqueue(message(1))
+    assert queue.flush(timeout=10)
+
+    stats = queue.stats()
+    assert stats['sent'] == 1 and stats['retried'] == 2
+    assert len(smtp_server.received) == 1
+    first, second, third = smtp_server.attempts
+    # Exponential backoff: about 0.2s, then about 0.4s
+    assert second - first >= 0.18
+    assert third - second >= 0.36
+
+
+def test_message_is_given_up_after_max_attempts(smtp_server):
+    smtp_server.fail_next = 100
+    queue = make_queue(smtp_server, MAIL_QUEUE_MAX_ATTEMPTS=3)
+    queue.enqueue(message(1))
+    assert queue.flush(timeout=10)
+
+    stats = queue.stats()
+    assert stats['failed'] == 1 and stats['retried'] == 2 and stats['sent'] == 0
+    assert len(smtp_server.attempts) == 3
+    assert smtp_server.received == []
+
+
+def test_unreachable_server_is_retried(smtp_server):
+    # Stop the stand-in, so the first attempt can't connect at all, then start it again on the same port
+    port = smtp_server.server_address[1]
+    stop_server(smtp_server)
+    queue = make_queue(smtp_server, MAIL_QUEUE_RETRY_DELAY=0.3, MAIL_QUEUE_MAX_ATTEMPTS=5)
+    queue.enqueue(message(1))
+
+    time.sleep(0.1)
+    server = start_server(port)
+    try:
+        assert queue.flush(timeout=10)
+        assert queue.stats()['sent'] == 1 and queue.stats()['retried'] >= 1
+        assert len(server.received) == 1
+    finally:
+        stop_server(server)
+
+
+def test_full_queue_drops_messages(smtp_server):
+    # No workers, so nothing is taken off the queue
+    queue = make_queue(smtp_server, MAIL_QUEUE_MAXSIZE=2, MAIL_QUEUE_WORKERS=0)
+    assert queue.enqueue(message(1))
+    assert queue.enqueue(message(2))
+    assert not queue.enqueue(message(3))
+
+    stats = queue.stats()
+    assert stats['enqueued'] == 2 and stats['dropped'] == 1
+    assert stats['pending'] == 2 and stats['depth'] == 2
+    # flush() gives up after the timeout when messages are still waiting
+    assert not queue.flush(timeout=0.1)
+
+
+# Runs in a child process: queue one message (the first attempt fails, so it waits for a retry), then exit at once
+EXITING_PROCESS = '''
+import sys
+from flask import Flask
+from flask_mail import Message
+from mail_queue import MailQueue
+app = Flask(__name__)
+app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=int(sys.argv[1]), MAIL_USE_TLS=False,
+                  MAIL_QUEUE_RETRY_DELAY=0.3, MAIL_QUEUE_EXIT_TIMEOUT=float(sys.argv[2]))
+MailQueue(app).enqueue(Message('Bye', sender='test@example.com', recipients=['user@example.com'], body='hello'))
+'''
+
+
+def run_exiting_process(smtp_server, exit_timeout):
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run([sys.executable, '-c', EXITING_PROCESS, str(smtp_server.server_address[1]), str(exit_timeout)],
+                          cwd=repo, capture_output=True, text=True, timeout=30)
+
+
+def test_waiting_messages_are_sent_before_the_process_exits(smtp_server):
+    smtp_server.fail_next = 1
+    result = run_exiting_process(smtp_server, exit_timeout=10)
+    assert result.returncode == 0, result.stderr
+    assert [recipients for recipients, _ in smtp_server.received] == [['user@example.com']]
+
+
+def test_exit_gives_up_after_the_timeout(smtp_server):
+    smtp_server.fail_next = 100
+    started = time.monotonic()
+    result = run_exiting_process(smtp_server, exit_timeout=0.5)
+    assert time.monotonic() - started < 10
+    assert 'still unsent' in result.stderr
+    assert smtp_server.received == []
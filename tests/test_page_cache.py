@@ -0,0 +1,109 @@
+import pytest
+
+import main
+from config import TestingConfig
+
+
+@pytest.fixture
+def workers(tmp_path):
+    # Two apps on one database file, like two gunicorn workers. Each has its own in-memory page cache.
+    class FileConfig(TestingConfig):
+        DB_URI = f'sqlite:///{tmp_path / "posts.sqlite"}'
+        PAGE_CACHE_ENABLED = True
+
+    writer, reader = main.create_app(FileConfig), main.create_app(FileConfig)
+    with writer.app_context():
+        main.db.create_all(bind_key=None)
+        author = main.User(username='author', email='author@example.com', password_hash='x')
+        main.db.session.add(author)
+        main.db.session.commit()
+        main.db.session.add(main.Post(title='First post', content='hello', user_id=author.id))
+        main.db.session.commit()
+    yield writer, reader
+    for app in (writer, reader):
+        with app.app_context():
+            main.db.session.remove()
+            main.db.engine.dispose()
+
+
+def logged_in_client(app):
+    client = app.test_client()
+    with client.session_transaction() as cookie_session:
+        cookie_session['user_id'] = 1
+    return client
+
+
+def pages(app):
+    client = app.test_client()
+    return client.get('/').get_data(as_text=True), client.get('/user/author').get_data(as_text=True)
+
+
+def change_behind_the_caches_back(app, title):
+    # Not through a route, so no generation is bumped: only a cache miss would show this title
+    with app.app_context():
+        main.db.session.get(main.Post, 1).title = title
+        main.db.session.commit()
+
+
+def test_pages_are_served_from_the_cache(workers):
+    writer, reader = workers
+    pages(reader)
+    change_behind_the_caches_back(writer, 'Sneaky title')
+    home, profile = pages(reader)
+    assert 'First post' in home and 'First post' in profile
+    assert 'Sneaky title' not in home and 'Sneaky title' not in profile
+
+
+@pytest.mark.parametrize('write', ['create', 'update', 'delete'])
+def test_post_writes_invalidate_the_pages_in_every_worker(workers, write):
+    writer, reader = workers
+    pages(reader)
+    client = logged_in_client(writer)
+    if write == 'create':
+        client.post('/create', data={'title': 'Brand new post', 'content': 'hi'})
+        expected, gone = 'Brand new post', None
+    elif write == 'update':
+        client.post('/post/1/update', data={'title': 'Edited title', 'content': 'hi'})
+        expected, gone = 'Edited title', 'First post'
+    else:
+        client.post('/post/1/delete')
+        expected, gone = None, 'First post'
+
+    for html in pages(reader):
+        if expected:
+            assert expected in html
+        if gone:
+            assert gone not in html
+
+
+def test_rename_invalidates_the_pages_in_every_worker(workers):
+    writer, reader = workers
+    pages(reader)
+    logged_in_client(writer).post('/account', data={'username': 'renamed', 'email': 'author@example.com'})
+
+    assert 'renamed' in pages(reader)[0]
+    assert reader.test_client().get('/user/author').status_code == 404
+    assert 'renamed' in reader.test_client().get('/user/renamed').get_data(as_text=True)
+
+
+def test_a_rolled_back_write_keeps_the_cached_pages(workers):
+    writer, reader = workers
+    pages(reader)
+    with writer.test_request_context('/'):
+        main.posts_changed('author')
+        main.db.session.rollback()
+    change_behind_the_caches_back(writer, 'Sneaky title')
+    assert 'Sneaky title' not in pages(reader)[0]
+
+
+def test_a_worker_with_the_old_name_cached_still_invalidates_the_right_profile(workers):
+    writer, reader = workers
+    # The reader worker caches the logged-in user as 'author'...
+    reader_client = logged_in_client(reader)
+    reader_client.get('/')
+    # ...then the account is renamed through the other worker, and the reader caches the new profile page
+    logged_in_client(writer).post('/account', data={'username': 'renamed', 'email': 'author@example.com'})
+    reader.test_client().get('/user/renamed')
+
+    reader_client.post('/create', data={'title': 'After the rename', 'content': 'hi'})
+    assert 'After the rename' in reader.test_client().get('/user/renamed').get_data(as_text=True)
@@ -0,0 +1,89 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, text
+
+import main
+
+SAME_MOMENT = datetime(2024, 1, 31, 10, 15, 0, 123456)
+
+
+@pytest.fixture
+def posts(app):
+    # 25 posts: 12 of them share one timestamp, so only the id tells them apart
+    with app.app_context():
+        author = main.User(username='author', email='author@example.com', password_hash='x')
+        for number in range(25):
+            date_posted = SAME_MOMENT if 5 <= number < 17 else SAME_MOMENT + timedelta(minutes=number)
+            main.db.session.add(main.Post(title=f'Post {number}', content='hello', excerpt='hello',
+                                          date_posted=date_posted, author=author))
+        main.db.session.commit()
+        # Newest first, ties broken by the higher id
+        return [post.id for post in main.Post.query.order_by(main.Post.date_posted.desc(), main.Post.id.desc())]
+
+
+def walk_api(client, path, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        response = client.get(path, query_string={'limit': limit, 'fields': 'id', **({'before': cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages += 1
+        ids += [post['id'] for post in response.json['posts']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return ids, pages
+
+
+@pytest.mark.parametrize('limit', [1, 5, 10, 12, 25, 50])
+def test_api_pages_return_every_post_once_in_order(client, posts, limit):
+    for path in ('/api/posts', '/api/users/author/posts'):
+        ids, pages = walk_api(client, path, limit)
+        assert ids == posts
+        assert pages == max(1, -(-len(posts) // limit))
+
+
+@pytest.mark.parametrize('path', ['/', '/user/author'])
+def test_html_pages_follow_the_older_posts_link(client, posts, path):
+    ids, url = [], path
+    while url:
+        html = client.get(url).get_data(as_text=True)
+        page = [int(post_id) for post_id in re.findall(r'href="/post/(\d+)" class="post-title-link"', html)]
+        assert len(page) <= main.POSTS_PER_PAGE
+        ids += page
+        older = re.search(r'href="([^"]*before=[^"]*)">Older posts', html)
+        url = older.group(1).replace('&amp;', '&') if older else None
+    assert ids == posts
+
+
+def test_a_cursor_in_the_middle_of_a_tie_skips_only_the_older_ids(client, posts):
+    tied = sorted(posts[8:20], reverse=True) # the 12 posts sharing SAME_MOMENT
+    cursor = f'{SAME_MOMENT.isoformat()},{tied[3]}'
+    response = client.get('/api/posts', query_string={'before': cursor, 'fields': 'id', 'limit': 100})
+    assert [post['id'] for post in response.json['posts']] == posts[posts.index(tied[3]) + 1:]
+
+
+@pytest.mark.parametrize('path', ['/', '/user/author', '/api/posts', '/api/users/author/posts'])
+@pytest.mark.parametrize('cursor', ['yesterday', '2024-01-31T10:15:00', '2024-13-45T10:15:00,1', '2024-01-31,abc'])
+def test_a_broken_cursor_is_a_bad_request(client, posts, path, cursor):
+    assert client.get(path, query_string={'before': cursor}).status_code == 400
+
+
+def test_profile_pages_use_the_user_index(app, posts):
+    with app.app_context():
+        query = main.Post.query.filter_by(user_id=1).order_by(main.Post.date_posted.desc(), main.Post.id.desc())
+        compiled = query.statement.compile(main.db.engine, compile_kwargs={'literal_binds': True})
+        plan = ' '.join(str(row) for row in main.db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+    assert 'ix_post_user_id_date_posted_id' in plan
+    assert 'TEMP B-TREE' not in plan # no sort step
+
+
+def test_backfill_adds_the_index_to_an_existing_table(app):
+    with app.app_context():
+        main.db.session.execute(text('DROP INDEX ix_post_user_id_date_posted_id'))
+        main.db.session.commit()
+    result = app.test_cli_runner().invoke(args=['backfill-post-summaries'])
+    assert result.exit_code == 0, result.output
+    assert 'Added indexes: ix_post_user_id_date_posted_id' in result.output
+    with app.app_context():
+        assert 'ix_post_user_id_date_posted_id' in {index['name'] for index in inspect(main.db.engine).get_indexes('post')}
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+from flask import Flask
+
+import password_hasher
+from config import TestingConfig
+from password_hasher import HashingBusy, PasswordHasher, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def make_hasher(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    return PasswordHasher(app)
+
+
+def test_rate_limiter_refills_over_time(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(password_hasher, 'time', clock)
+    limiter = RateLimiter(rate=0.5, burst=2)
+
+    assert limiter.allow('1.2.3.4')
+    assert limiter.allow('1.2.3.4')
+    assert not limiter.allow('1.2.3.4')
+    # Other keys have their own bucket
+    assert limiter.allow('5.6.7.8')
+
+    clock.now += 1 # half a token
+    assert not limiter.allow('1.2.3.4')
+    clock.now += 1 # one whole token
+    assert limiter.allow('1.2.3.4')
+    assert not limiter.allow('1.2.3.4')
+
+    clock.now += 60 # never more than the burst
+    assert limiter.allow('1.2.3.4')
+    assert limiter.allow('1.2.3.4')
+    assert not limiter.allow('1.2.3.4')
+
+
+def test_rate_limiter_forgets_old_keys():
+    limiter = RateLimiter(rate=0, burst=1, max_keys=2)
+    for key in ('a', 'b', 'c'):
+        assert limiter.allow(key)
+    # 'a' was evicted, so it starts again with a full bucket
+    assert limiter.allow('a')
+    assert not limiter.allow('c')
+
+
+def test_full_hashing_queue_returns_503():
+    class BusyConfig(TestingConfig):
+        PASSWORD_HASH_MAX_PENDING = 0
+
+    import main
+    app = main.create_app(BusyConfig)
+    with app.app_context():
+        main.db.create_all(bind_key=None)
+    response = app.test_client().post('/register', data={'username': 'a', 'email': 'a@example.com',
+                                                         'password': 'Password1!'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert app.extensions['password_hasher'].stats()['rejected'] == 1
+
+
+def test_timeout_raises_busy_and_keeps_the_slot_until_the_job_finishes():
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_TIMEOUT=0.2)
+    try:
+        with pytest.raises(HashingBusy):
+            hasher._run(time.sleep, 1.5)
+        assert hasher.stats()['timed_out'] == 1
+        # The sleeping job still holds the only slot, so new work is refused straight away
+        with pytest.raises(HashingBusy):
+            hasher._run(time.sleep, 0)
+        assert hasher.stats()['rejected'] == 1
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                hasher._run(time.sleep, 0)
+                break
+            except HashingBusy:
+                time.sleep(0.1)
+        assert hasher.stats()['completed'] == 1
+    finally:
+        hasher._pool.shutdown()
+
+
+def test_hash_and_check_inline():
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    hashed = hasher.hash('Secret1!')
+    assert hasher.check(hashed, 'Secret1!')
+    assert not hasher.check(hashed, 'wrong')
+    assert not hasher.needs_rehash(hashed)
+    assert hasher.needs_rehash('scrypt:1:1:1$salt$hash')
+
+
+def test_default_pool_shares_the_cores_between_web_workers(monkeypatch):
+    monkeypatch.setattr(password_hasher.os, 'cpu_count', lambda: 8)
+    assert make_hasher().workers == 8
+    assert make_hasher(WEB_CONCURRENCY=4).workers == 2
+
+    # More web workers than cores: still one hashing process (and a few queue slots) each
+    app = Flask(__name__)
+    app.config['WEB_CONCURRENCY'] = 16
+    assert PasswordHasher(app).workers == 1
+    assert app.config['PASSWORD_HASH_MAX_PENDING'] == 4
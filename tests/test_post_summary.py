@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+import main
+from post_summary import EXCERPT_LENGTH, make_excerpt
+
+
+def test_short_content_is_one_line_of_plain_text():
+    assert make_excerpt('  Hello\n\n\tworld  ') == 'Hello world'
+    assert make_excerpt(None) == ''
+    assert make_excerpt('x' * EXCERPT_LENGTH) == 'x' * EXCERPT_LENGTH
+
+
+def test_long_content_is_cut_at_a_whole_word():
+    excerpt = make_excerpt('word ' * 100)
+    assert excerpt.endswith('word...')
+    assert len(excerpt) <= EXCERPT_LENGTH + 3
+    # Punctuation before the cut is dropped, so there is no "end,..."
+    assert make_excerpt('one, two, three', length=9) == 'one, two...'
+    # A single "word" longer than the excerpt (e.g. a URL) is simply cut
+    assert make_excerpt('https://' + 'a' * 300, length=20) == 'https://aaaaaaaaaaaa...'
+
+
+def log_in_author(app, client):
+    with app.app_context():
+        author = main.User(username='author', email='author@example.com', password_hash='x')
+        main.db.session.add(author)
+        main.db.session.commit()
+        author_id = author.id
+    with client.session_transaction() as cookie_session:
+        cookie_session['user_id'] = author_id
+    return author_id
+
+
+def counters(app, user_id):
+    with app.app_context():
+        user = main.db.session.get(main.User, user_id)
+        newest = main.Post.query.order_by(main.Post.date_posted.desc()).first()
+        return user.post_count, user.last_posted_at, newest.date_posted if newest else None
+
+
+def test_post_routes_keep_the_author_counters_up_to_date(app, client):
+    author_id = log_in_author(app, client)
+    assert counters(app, author_id) == (0, None, None)
+
+    for title in ('First', 'Second'):
+        client.post('/create', data={'title': title, 'content': 'hello'})
+    count, last_posted_at, newest = counters(app, author_id)
+    assert count == 2 and last_posted_at == newest
+
+    # Editing changes neither counter
+    client.post('/post/1/update', data={'title': 'Edited', 'content': 'hello'})
+    assert counters(app, author_id) == (2, last_posted_at, newest)
+
+    # Deleting the newest post moves last_posted_at back to the one before it
+    client.post('/post/2/delete')
+    count, last_posted_at, newest = counters(app, author_id)
+    assert count == 1 and last_posted_at == newest
+    client.post('/post/1/delete')
+    assert counters(app, author_id) == (0, None, None)
+
+
+def test_the_feed_loads_only_the_author_columns_it_shows(app, client):
+    # The logged-in user is also the author of every post on the page (raiseload would catch a lazy load)
+    log_in_author(app, client)
+    client.post('/create', data={'title': 'Mine', 'content': 'hello'})
+    app.extensions['user_cache'].clear()
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'Mine' in response.get_data(as_text=True)
+
+
+def test_backfill_adds_the_columns_and_fills_them_in_batches(app):
+    # A database from before excerpts and counters existed
+    with app.app_context():
+        for table, column in (('post', 'excerpt'), ('users', 'post_count'), ('users', 'last_posted_at')):
+            main.db.session.execute(text(f'ALTER TABLE {table} DROP COLUMN {column}'))
+        main.db.session.execute(text("INSERT INTO users (id, username, email, password_hash) VALUES "
+                                     "(1, 'author', 'author@example.com', 'x'), (2, 'quiet', 'quiet@example.com', 'x')"))
+        for post_id in range(1, 6):
+            main.db.session.execute(text('INSERT INTO post (id, title, content, date_posted, user_id) '
+                                         'VALUES (:id, :title, :content, :date_posted, 1)'),
+                                    {'id': post_id, 'title': f'Post {post_id}', 'content': f'Body\n of {post_id}',
+                                     'date_posted': datetime(2024, 1, post_id)})
+        main.db.session.commit()
+        engine = main.db.engine
+
+    statements = []
+    record = lambda conn, cursor, statement, parameters, context, executemany: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = app.test_cli_runner().invoke(args=['backfill-post-summaries', '--batch-size', '2'])
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert result.exit_code == 0, result.output
+    assert 'Added columns: excerpt, post_count, last_posted_at' in result.output
+    assert 'wrote 5 excerpts and recounted 2 users' in result.output
+    # 5 posts in batches of 2: three excerpt UPDATEs, each for a whole batch
+    assert len([statement for statement in statements if statement.startswith('UPDATE post SET excerpt')]) == 3
+
+    with app.app_context():
+        assert [post.excerpt for post in main.Post.query.order_by(main.Post.id)] == [f'Body of {n}' for n in range(1, 6)]
+        author, quiet = main.User.query.order_by(main.User.id)
+        assert (author.post_count, author.last_posted_at) == (5, datetime(2024, 1, 5))
+        assert (quiet.post_count, quiet.last_posted_at) == (0, None)
+
+    # Run again: nothing left to write, and counters that drifted are repaired
+    with app.app_context():
+        main.db.session.execute(text('UPDATE users SET post_count = 42'))
+        main.db.session.commit()
+    result = app.test_cli_runner().invoke(args=['backfill-post-summaries'])
+    assert 'Added columns' not in result.output
+    assert 'wrote 0 excerpts' in result.output
+    assert counters(app, 1)[0] == 5
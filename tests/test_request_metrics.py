@@ -0,0 +1,88 @@
+import re
+
+import main
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="([^"]*)"')
+
+
+def scrape(client):
+    # {name: type} and [(name, {label: value}, value)] from the Prometheus text format
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    types, samples = {}, []
+    for line in response.get_data(as_text=True).splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, metric_type = line.split(' ')
+            types[name] = metric_type
+        elif line and not line.startswith('#'):
+            name, labels, value = SAMPLE.match(line).groups()
+            samples.append((name, dict(LABEL.findall(labels or '')), float(value)))
+    return types, samples
+
+
+def family(name, types):
+    # The histogram's _bucket/_sum/_count samples belong to the metric declared without the suffix
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in types:
+            return name[:-len(suffix)]
+    return name
+
+
+def test_metrics_are_valid_prometheus_text(client):
+    for _ in range(3):
+        client.get('/')
+    client.get('/post/12345')
+    types, samples = scrape(client)
+
+    # Every sample belongs to a declared metric, and every counter is named ..._total
+    for name, labels, value in samples:
+        assert family(name, types) in types, name
+    assert [name for name, metric_type in types.items() if metric_type == 'counter' and not name.endswith('_total')] == []
+
+    assert ('http_requests_total', {'endpoint': 'main.home', 'method': 'GET', 'status': '200'}, 3) in samples
+    assert ('http_requests_total', {'endpoint': 'main.post_detail', 'method': 'GET', 'status': '404'}, 1) in samples
+
+    # Histogram: cumulative buckets ending in +Inf, which equals _count
+    assert types['http_request_duration_seconds'] == 'histogram'
+    home = {'endpoint': 'main.home', 'method': 'GET'}
+    buckets = [(labels['le'], value) for name, labels, value in samples
+               if name == 'http_request_duration_seconds_bucket' and {**labels, 'le': None} == {**home, 'le': None}]
+    assert [le for le, value in buckets][-1] == '+Inf'
+    assert [float(le) for le, value in buckets[:-1]] == sorted(float(le) for le, value in buckets[:-1])
+    counts = [value for le, value in buckets]
+    assert counts == sorted(counts) and counts[-1] == 3
+    assert ('http_request_duration_seconds_count', home, 3) in samples
+
+
+def test_service_totals_are_counters_and_levels_are_gauges(client):
+    types, samples = scrape(client)
+    assert types['mail_queue_sent_total'] == 'counter'
+    assert types['password_hash_completed_total'] == 'counter'
+    assert types['password_hash_hash_seconds_total'] == 'counter'
+    assert types['response_compressed_responses_total'] == 'counter'
+    assert types['mail_queue_pending'] == 'gauge'
+    assert types['password_hash_max_queue_wait_seconds'] == 'gauge'
+    assert 'mail_queue_sent' not in types
+
+
+def test_a_repeated_statement_shape_is_counted_as_n_plus_one(app, client, caplog):
+    def one_query_per_user():
+        for user_id in range(app.config['METRICS_N_PLUS_ONE_THRESHOLD']):
+            main.db.session.get(main.User, user_id + 1)
+        return 'ok'
+    app.add_url_rule('/n-plus-one', 'n_plus_one', one_query_per_user)
+    app.add_url_rule('/one-query', 'one_query', lambda: str(main.User.query.count()))
+
+    client.get('/n-plus-one')
+    client.get('/n-plus-one')
+    client.get('/one-query')
+    types, samples = scrape(client)
+
+    assert types['n_plus_one_requests_total'] == 'counter'
+    assert ('n_plus_one_requests_total', {'endpoint': 'n_plus_one'}, 2) in samples
+    assert not [labels for name, labels, value in samples
+                if name == 'n_plus_one_requests_total' and labels['endpoint'] == 'one_query']
+    assert ('db_queries_total', {'endpoint': 'n_plus_one'}, 2 * app.config['METRICS_N_PLUS_ONE_THRESHOLD']) in samples
+    assert 'Possible N+1 in n_plus_one' in caplog.text
@@ -0,0 +1,94 @@
+import gzip
+import re
+
+import pytest
+from flask import Flask, Response, render_template_string
+
+from response_optimizer import ONE_YEAR, ResponseOptimizer, optimize
+
+PAGE = '<p>' + 'hello world ' * 100 + '</p>'
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def bare_app(tmp_path):
+    # A tiny app with one route per case, so the tests don't depend on the blog's pages
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'style.css').write_text('body { color: black; }')
+    app = Flask(__name__, static_folder=str(tmp_path), static_url_path='/static')
+    app.config['RESPONSE_COMPRESSION_MIN_SIZE'] = 500
+    app.add_url_rule('/page', 'page', lambda: PAGE)
+    app.add_url_rule('/small', 'small', lambda: '<p>tiny</p>')
+    app.add_url_rule('/uncompressed', 'uncompressed', optimize(compress=False)(lambda: PAGE))
+    app.add_url_rule('/plain', 'plain', optimize(compress=False, etag=False)(lambda: PAGE))
+    app.add_url_rule('/stream', 'stream', lambda: Response(iter([PAGE]), mimetype='text/html'))
+    app.add_url_rule('/styled', 'styled', lambda: render_template_string("{{ asset_url('css/style.css') }}"))
+    ResponseOptimizer(app)
+    return app
+
+
+def test_unchanged_pages_answer_304(bare_app):
+    client = bare_app.test_client()
+    first = client.get('/page')
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('W/')
+    assert 'no-cache' in first.headers['Cache-Control']
+
+    again = client.get('/page', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert client.get('/page', headers={'If-None-Match': 'W/"something-else"'}).status_code == 200
+    assert bare_app.extensions['response_optimizer'].stats()['not_modified_responses'] == 1
+
+
+def test_only_responses_above_the_threshold_are_compressed(bare_app):
+    client = bare_app.test_client()
+    big = client.get('/page', headers=GZIP)
+    assert big.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in big.headers['Vary']
+    assert gzip.decompress(big.data).decode() == PAGE
+
+    small = client.get('/small', headers=GZIP)
+    assert 'Content-Encoding' not in small.headers
+    assert small.data == b'<p>tiny</p>'
+    # A client that doesn't accept gzip gets the plain page
+    assert 'Content-Encoding' not in client.get('/page').headers
+
+    stats = bare_app.extensions['response_optimizer'].stats()
+    assert stats['compressed_responses'] == 1
+    assert stats['bytes_after'] < stats['bytes_before'] == len(PAGE)
+
+
+def test_routes_can_opt_out(bare_app):
+    client = bare_app.test_client()
+    uncompressed = client.get('/uncompressed', headers=GZIP)
+    assert 'Content-Encoding' not in uncompressed.headers
+    assert uncompressed.get_data(as_text=True) == PAGE
+    # ...but it still gets an ETag
+    assert client.get('/uncompressed', headers={'If-None-Match': uncompressed.headers['ETag']}).status_code == 304
+
+    plain = client.get('/plain', headers=GZIP)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'ETag' not in plain.headers
+    assert plain.get_data(as_text=True) == PAGE
+
+    # Streamed responses are never buffered
+    assert 'Content-Encoding' not in client.get('/stream', headers=GZIP).headers
+
+
+def test_fingerprinted_static_files_are_cached_for_a_year(bare_app):
+    client = bare_app.test_client()
+    url = client.get('/styled').get_data(as_text=True)
+    assert re.fullmatch(r'/static/css/style\.css\?v=[0-9a-f]{12}', url)
+
+    cache_control = client.get(url).headers['Cache-Control']
+    assert 'immutable' in cache_control and 'public' in cache_control
+    assert f'max-age={ONE_YEAR}' in cache_control and 'no-cache' not in cache_control
+
+    # Without the fingerprint the browser must check again
+    assert 'immutable' not in client.get('/static/css/style.css').headers.get('Cache-Control', '')
+
+
+def test_the_layout_links_the_fingerprinted_stylesheet(client):
+    html = client.get('/').get_data(as_text=True)
+    assert re.search(r'href="/static/css/style\.css\?v=[0-9a-f]{12}"', html)
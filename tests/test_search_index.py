@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import main
+from search_index import SearchIndex
+
+
+@pytest.fixture
+def posts(app):
+    with app.app_context():
+        author = main.User(username='author', email='author@example.com', password_hash='x')
+        main.db.session.add_all([main.Post(title='Flask tips', content='routes and views', author=author),
+                                 main.Post(title='Cooking', content='pasta recipes', author=author)])
+        main.db.session.commit()
+        yield main.Post.query.order_by(main.Post.id).all()
+
+
+def make_index(tmp_path):
+    # A second SearchIndex on the same file stands in for another worker process
+    index = SearchIndex()
+    index.path = str(tmp_path / 'search_index.json')
+    return index
+
+
+def found(index, query):
+    return index.search(main.Post, query)[0]
+
+
+def test_posts_edited_after_the_snapshot_are_reindexed(tmp_path, posts):
+    flask_post, cooking_post = posts
+    index = make_index(tmp_path)
+    assert found(index, 'flask') == [flask_post.id]
+    index.save()
+
+    # Another process edits one post and deletes the other while this snapshot sits on disk
+    flask_post.title = 'Django tips'
+    main.db.session.delete(cooking_post)
+    main.db.session.commit()
+
+    restarted = make_index(tmp_path)
+    assert found(restarted, 'flask') == []
+    assert found(restarted, 'django') == [flask_post.id]
+    assert found(restarted, 'pasta') == []
+
+
+def test_saves_from_two_workers_are_merged(tmp_path, posts):
+    flask_post, cooking_post = posts
+    first, second = make_index(tmp_path), make_index(tmp_path)
+    first.ensure_loaded(main.Post)
+    second.ensure_loaded(main.Post)
+
+    # Each worker handles a different edit, then both save at exit
+    flask_post.title = 'Django tips'
+    main.db.session.commit()
+    first.add(main.Post, flask_post)
+    new_post = main.Post(title='Baking', content='bread', user_id=flask_post.user_id)
+    main.db.session.add(new_post)
+    main.db.session.commit()
+    second.add(main.Post, new_post)
+    first.save()
+    second.save()
+
+    with open(first.path, encoding='utf-8') as f:
+        docs = json.load(f)['docs']
+    assert 'django' in docs[str(flask_post.id)]
+    assert str(new_post.id) in docs
+
+
+def test_rebuild_replaces_the_snapshot(tmp_path, posts):
+    flask_post, cooking_post = posts
+    index = make_index(tmp_path)
+    index.ensure_loaded(main.Post)
+    index.save()
+
+    main.db.session.delete(cooking_post)
+    main.db.session.commit()
+    rebuilt = make_index(tmp_path)
+    assert rebuilt.rebuild(main.Post) == 1
+    rebuilt.save(merge=False)
+
+    with open(index.path, encoding='utf-8') as f:
+        assert list(json.load(f)['docs']) == [str(flask_post.id)]
+
+
+def test_snapshot_without_versions_is_rebuilt(tmp_path, posts):
+    flask_post, cooking_post = posts
+    index = make_index(tmp_path)
+    with open(index.path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'docs': {str(flask_post.id): {'stale': 1}}}, f)
+
+    assert not index.load(main.Post)
+    assert found(index, 'stale') == []
+    assert found(index, 'pasta') == [cooking_post.id]